@@ -2,21 +2,77 @@ import sys
 from urllib.request import urlopen
 from urllib.error import URLError, HTTPError
 
-def check_url_status(url, timeout = 5):
+#host names are resolved through the cache of zbx_dns.py when it is in the scripts dir too
+try:
+    from zbx_dns import DnsCache
+except ImportError:
+    DnsCache = None
+
+#and results are shared through the cache of zbx_urlcache.py when that is there
+try:
+    from zbx_urlcache import UrlResultCache
+except ImportError:
+    UrlResultCache = None
+
+#return an opener whose connections get their addresses from dns
+#the Host header and the TLS server name stay the host name of the url
+def dns_opener(dns):
+    import http.client
+    import urllib.request
+
+    class HTTPConnection(http.client.HTTPConnection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._create_connection = dns.create_connection
+
+    class HTTPSConnection(http.client.HTTPSConnection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._create_connection = dns.create_connection
+
+    class HTTPHandler(urllib.request.HTTPHandler):
+        def http_open(self, req):
+            return self.do_open(HTTPConnection, req)
+
+    class HTTPSHandler(urllib.request.HTTPSHandler):
+        def https_open(self, req):
+            return self.do_open(HTTPSConnection, req, context=self._context)
+
+    return urllib.request.build_opener(HTTPHandler, HTTPSHandler)
+
+#return 0 when url answers 200, 1 otherwise
+def url_status(url, timeout = 5, dns = None):
     if not (url.startswith("http://") or url.startswith("https://")):
         #print("Error: URL should start with 'http://' or 'https://'")
-        print(1)
-        return
+        return 1
+    if dns is None and DnsCache is not None:
+        dns = DnsCache()
     try:
-        response = urlopen(url, timeout = timeout)
+        if dns is not None:
+            response = dns_opener(dns).open(url, timeout = timeout)
+        else:
+            response = urlopen(url, timeout = timeout)
         if response.status == 200:
-            print(0)
+            return 0
         else:
-            print(1)
+            return 1
     except HTTPError as e:
-        print(1)
+        return 1
     except URLError as e:
-        print(1)
+        return 1
+    finally:
+        if dns is not None:
+            dns.save()
+
+#url_status, answered from the result cache while it is fresh; concurrent calls for the
+#same url wait for one probe
+def cached_url_status(url, timeout = 5):
+    if UrlResultCache is None:
+        return url_status(url, timeout)
+    return UrlResultCache().get(url, lambda: url_status(url, timeout))
+
+def check_url_status(url, timeout = 5):
+    print(cached_url_status(url, timeout))
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
@@ -0,0 +1,22 @@
+#the zbx_* modules are deployed flat into the scripts dir, import them from userparam
+#configs, caches and state files go to a temporary scripts dir instead of /etc/zabbix/scripts
+
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'userparam'))
+
+_scripts_dir = tempfile.mkdtemp(prefix='zbx_scripts.')
+os.environ['ZBX_SCRIPTS_DIR'] = _scripts_dir
+os.environ['ZBX_CACHE_DIR'] = os.path.join(_scripts_dir, 'cache')
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_scripts_dir, ignore_errors=True)
+
+@pytest.fixture
+def scripts_dir():
+    return _scripts_dir
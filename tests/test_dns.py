@@ -0,0 +1,110 @@
+#zbx_dns.DnsCache with a stub resolver, runs offline
+
+import time
+import socket
+import threading
+
+import pytest
+
+import zbx_dns
+from zbx_dns import DnsCache
+
+#resolver answering from a dict, counting lookups; a host mapped to an exception raises it
+class StubResolver:
+    def __init__(self, answers, delay=0.0):
+        self.answers = answers
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, host):
+        with self.lock:
+            self.calls.append(host)
+        if self.delay:
+            time.sleep(self.delay)
+        answer = self.answers.get(host)
+        if answer is None:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'zbx_dns.cache')
+
+def test_answers_within_ttl_are_not_resolved_again(cache_path):
+    resolver = StubResolver({'a.example': ['10.0.0.1']})
+    dns = DnsCache(cache_path, ttl=300, resolver=resolver)
+    assert dns.resolve_all(['a.example']) == {'a.example': ['10.0.0.1']}
+    assert dns.resolve_all(['a.example']) == {'a.example': ['10.0.0.1']}
+    assert resolver.calls == ['a.example']
+
+def test_answers_persist_between_runs(cache_path):
+    dns = DnsCache(cache_path, ttl=300, resolver=StubResolver({'a.example': ['10.0.0.1']}))
+    dns.resolve_all(['a.example'])
+    dns.save()
+    resolver = StubResolver({})
+    assert DnsCache(cache_path, ttl=300, resolver=resolver).resolve_all(['a.example']) == {'a.example': ['10.0.0.1']}
+    assert resolver.calls == []
+
+def test_unique_names_resolved_once_and_concurrently(cache_path):
+    hosts = ['h%d.example' % i for i in range(8)]
+    resolver = StubResolver(dict((host, ['10.0.0.%d' % i]) for i, host in enumerate(hosts)), delay=0.3)
+    dns = DnsCache(cache_path, resolver=resolver)
+    start = time.monotonic()
+    answers = dns.resolve_all(hosts + hosts, timeout=2.0)
+    assert time.monotonic() - start < 1.0
+    assert sorted(resolver.calls) == sorted(hosts)
+    assert answers['h3.example'] == ['10.0.0.3']
+
+def test_expired_answer_is_used_while_refreshing(cache_path):
+    resolver = StubResolver({'a.example': ['10.0.0.1']})
+    dns = DnsCache(cache_path, ttl=300, resolver=resolver)
+    dns.entries['a.example'] = [time.time() - 600, ['10.0.0.9']]
+    resolver.delay = 0.5
+    start = time.monotonic()
+    assert dns.resolve_all(['a.example'], timeout=2.0) == {'a.example': ['10.0.0.9']}
+    assert time.monotonic() - start < 0.4
+    #save() collects the refresh that finished meanwhile
+    time.sleep(0.6)
+    dns.save()
+    assert DnsCache(cache_path, ttl=300, resolver=StubResolver({})).resolve_all(['a.example']) == {'a.example': ['10.0.0.1']}
+
+def test_stale_answer_is_kept_while_the_resolver_fails(cache_path):
+    resolver = StubResolver({'a.example': socket.gaierror(socket.EAI_AGAIN, "Temporary failure in name resolution")})
+    dns = DnsCache(cache_path, ttl=300, resolver=resolver)
+    dns.entries['a.example'] = [time.time() - 3600, ['10.0.0.9']]
+    assert dns.resolve_all(['a.example']) == {'a.example': ['10.0.0.9']}
+    dns.save()
+    #the failed refresh does not drop the answer
+    assert dns.entries['a.example'][1] == ['10.0.0.9']
+
+def test_answer_older_than_stale_ttl_is_not_used(cache_path):
+    dns = DnsCache(cache_path, resolver=StubResolver({}))
+    dns.entries['a.example'] = [time.time() - zbx_dns.STALE_TTL - 10, ['10.0.0.9']]
+    assert dns.resolve_all(['a.example']) == {}
+    assert dns.errors['a.example'] == "Name or service not known"
+
+def test_slow_lookup_is_left_out_after_timeout(cache_path):
+    dns = DnsCache(cache_path, resolver=StubResolver({'slow.example': ['10.0.0.1']}, delay=1.0))
+    assert dns.resolve_all(['slow.example'], timeout=0.2) == {}
+    assert "no answer within" in dns.errors['slow.example']
+
+def test_addresses_are_not_looked_up(cache_path):
+    resolver = StubResolver({})
+    dns = DnsCache(cache_path, resolver=resolver)
+    assert dns.resolve_all(['127.0.0.1', '::1']) == {'127.0.0.1': ['127.0.0.1'], '::1': ['::1']}
+    assert resolver.calls == []
+
+def test_ttl_from_environment(monkeypatch, cache_path):
+    monkeypatch.setenv('ZBX_DNS_TTL', '0')
+    resolver = StubResolver({'a.example': ['10.0.0.1']})
+    dns = DnsCache(cache_path, resolver=resolver)
+    dns.resolve_all(['a.example'])
+    #the expired answer is refreshed in the background
+    dns.resolve_all(['a.example'])
+    end = time.monotonic() + 2
+    while len(resolver.calls) < 2 and time.monotonic() < end:
+        time.sleep(0.01)
+    assert resolver.calls == ['a.example', 'a.example']
@@ -0,0 +1,81 @@
+#moncheck[tcpport] against local listening sockets and closed ports
+
+import socket
+
+import pytest
+
+import zbx_netcheck
+from zbx_dns import DnsCache
+
+@pytest.fixture
+def listener():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(16)
+    yield sock.getsockname()[1]
+    sock.close()
+
+#a port nothing listens on: bound but not listening, so no other test can take it meanwhile
+@pytest.fixture
+def closed_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    yield sock.getsockname()[1]
+    sock.close()
+
+def row(tag, host, port):
+    return {'{#TAG}': tag, '{#HOSTNAME}': host, '{#PORT}': str(port), '{#SEVERITY}': 'HIGH'}
+
+def check(rows, **kwargs):
+    return zbx_netcheck.check_ports(rows, dns=DnsCache(persistent=False), **kwargs)
+
+#without /proc/net every endpoint is connected to
+@pytest.fixture
+def no_proc_net(monkeypatch, tmp_path):
+    monkeypatch.setattr(zbx_netcheck, 'PROC_NET', str(tmp_path / 'missing'))
+
+def test_connect_open_and_closed(no_proc_net, listener, closed_port):
+    checks = check([row('open', '127.0.0.1', listener), row('closed', '127.0.0.1', closed_port)])
+    assert checks['open']['up'] == 1
+    assert checks['open']['method'] == 'connect'
+    assert checks['open']['ms'] is not None and checks['open']['error'] == ''
+    assert checks['closed']['up'] == 0
+    assert checks['closed']['ms'] is None and checks['closed']['error']
+
+def test_tags_keep_config_order(no_proc_net, listener, closed_port):
+    rows = [row('b', '127.0.0.1', closed_port), row('a', '127.0.0.1', listener), row('c', '127.0.0.1', listener)]
+    assert list(check(rows)) == ['b', 'a', 'c']
+
+@pytest.mark.skipif(zbx_netcheck.read_listeners() is None, reason="needs /proc/net/tcp")
+def test_local_endpoints_read_from_socket_table(listener, closed_port):
+    checks = check([row('open', '127.0.0.1', listener), row('closed', 'localhost', closed_port)])
+    assert checks['open'] == {'up': 1, 'ms': None, 'error': '', 'method': 'listen'}
+    assert checks['closed']['up'] == 0
+    assert checks['closed']['method'] == 'listen'
+
+def test_invalid_port_only_fails_its_tag(no_proc_net, listener):
+    checks = check([row('bad', '127.0.0.1', 'x'), row('range', '127.0.0.1', 70000), row('open', '127.0.0.1', listener)])
+    assert checks['bad']['up'] == 0 and "invalid port 'x'" in checks['bad']['error']
+    assert checks['range']['up'] == 0 and "invalid port '70000'" in checks['range']['error']
+    assert checks['open']['up'] == 1
+
+def test_unresolved_host_is_down(no_proc_net):
+    def resolver(host):
+        raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+    checks = zbx_netcheck.check_ports([row('nx', 'nx.invalid', 80)], dns=DnsCache(persistent=False, resolver=resolver))
+    assert checks['nx']['up'] == 0
+    assert checks['nx']['error'] == "Name or service not known"
+
+#a blackholed endpoint is cut off by the deadline, the others still answer
+def test_deadline_bounds_the_check(no_proc_net, listener, monkeypatch):
+    import asyncio
+    real_open = asyncio.open_connection
+
+    async def open_connection(host, port, **kwargs):
+        if port == 9:
+            await asyncio.sleep(10)
+        return await real_open(host, port, **kwargs)
+    monkeypatch.setattr(asyncio, 'open_connection', open_connection)
+    checks = check([row('slow', '127.0.0.1', 9), row('open', '127.0.0.1', listener)], deadline=0.5)
+    assert checks['slow']['up'] == 0 and checks['slow']['error']
+    assert checks['open']['up'] == 1
@@ -0,0 +1,81 @@
+#moncheck[process] over made-up process tuples, and one real /proc scan
+
+import os
+import sys
+import time
+import subprocess
+
+import pytest
+
+import zbx_proc
+from zbx_patterns import PatternError
+
+#read_process() tuples, pids no real process has
+PROCESSES = [
+    (4000001, 'nginx', 0, 'S', 100, 50, 1000, 10, 1, ['nginx: master process']),
+    (4000002, 'nginx', 33, 'S', 200, 20, 2000, 20, 2, ['nginx: worker process']),
+    (4000003, 'python3', 33, 'S', 10, 10, 500, 30, 4, ['/usr/bin/python3', '/srv/app.py', '--port', '80']),
+    (4000004, 'very-long-daemo', 0, 'S', 0, 0, 100, 40, 1, ['/usr/sbin/very-long-daemon-name']),
+]
+
+def row(tag, process='', user='', cmdline=''):
+    return {'{#TAG}': tag, '{#PROCESS}': process, '{#USER}': user, '{#CMDLINE}': cmdline, '{#COUNT}': '1',
+            '{#SEVERITY}': 'HIGH'}
+
+def metrics(rows, tmp_path, uptime=100.0, processes=PROCESSES):
+    return zbx_proc.process_metrics(rows, snapshot=(uptime, processes), state_path=str(tmp_path / 'state'))
+
+def test_rows_match_like_proc_num(tmp_path):
+    values = metrics([row('nginx', 'nginx'), row('root', 'nginx', 'root'), row('app', 'python3', cmdline='app\\.py'),
+                      row('long', 'very-long-daemon-name'), row('any', cmdline='process$')], tmp_path)
+    assert values['nginx']['count'] == 2 and values['nginx']['threads'] == 3
+    assert values['root']['count'] == 1
+    assert values['app']['count'] == 1
+    assert values['long']['count'] == 1
+    assert values['any']['count'] == 2
+    assert all(value['error'] == '' for value in values.values())
+
+def test_invalid_cmdline_only_fails_its_tag(tmp_path):
+    values = metrics([row('nginx', 'nginx'), row('bad', 'python3', cmdline='app('), row('any', cmdline='[')], tmp_path)
+    assert list(values) == ['nginx', 'bad', 'any']
+    assert values['nginx']['count'] == 2 and values['nginx']['error'] == ''
+    for tag in ('bad', 'any'):
+        assert values[tag]['count'] == 0
+        assert values[tag]['error'].startswith("zbx_processMonitor.conf: tag '%s', cmdline:" % tag)
+
+def test_invalid_cmdline_raises_without_errors():
+    with pytest.raises(PatternError):
+        zbx_proc.match_processes([row('bad', cmdline='(')], PROCESSES)
+
+def test_unknown_user_matches_nothing(tmp_path):
+    values = metrics([row('nouser', 'nginx', 'no-such-user-zbx'), row('nginx', 'nginx')], tmp_path)
+    assert values['nouser']['count'] == 0 and values['nouser']['error'] == ''
+    assert values['nginx']['count'] == 2
+
+def test_cpu_is_the_difference_to_the_previous_sample(tmp_path):
+    ticks = os.sysconf('SC_CLK_TCK')
+    metrics([row('nginx', 'nginx')], tmp_path, uptime=100.0)
+    later = [process[:4] + (process[4] + ticks, process[5]) + process[6:] for process in PROCESSES]
+    values = metrics([row('nginx', 'nginx')], tmp_path, uptime=110.0, processes=later)
+    #two processes, one second of user time each over ten seconds
+    assert values['nginx']['cpu_user'] == 20.0
+    assert values['nginx']['cpu_system'] == 0.0
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="reads /proc")
+def test_real_scan_finds_a_child(tmp_path):
+    child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)', 'zbx-proc-test'])
+    try:
+        #scan until the child has exec'd
+        end = time.monotonic() + 5
+        while True:
+            values = zbx_proc.process_metrics([row('child', cmdline='zbx-proc-test$'), row('bad', cmdline='(')],
+                                              snapshot=(zbx_proc.read_uptime(), zbx_proc.scan()),
+                                              state_path=str(tmp_path / 'state'))
+            if values['child']['count'] or time.monotonic() > end:
+                break
+            time.sleep(0.05)
+    finally:
+        child.kill()
+        child.wait()
+    assert values['child']['count'] == 1 and values['child']['fds'] > 0
+    assert values['bad']['count'] == 0 and values['bad']['error']
@@ -0,0 +1,61 @@
+#moncheck[customscript] and the scheduler with an invalid interval on one row
+
+import os
+import sys
+
+import pytest
+
+import zbx_scheduler
+from zbx_scriptrun import run_scripts
+
+pytestmark = pytest.mark.skipif(sys.platform.startswith('win'), reason="scripts are run by sh")
+
+CONFIG = "zbx_customScriptMonitor.conf"
+
+def row(tag, script, interval=''):
+    return {'{#TAG}': tag, '{#SCRIPT}': script, '{#SEVERITY}': 'HIGH', '{#INTERVAL}': interval}
+
+@pytest.fixture
+def config(scripts_dir):
+    path = os.path.join(scripts_dir, CONFIG)
+
+    def write(*lines):
+        with open(path, 'w') as f:
+            f.write("#tag;script;severity;interval\n")
+            for line in lines:
+                f.write(line + "\n")
+    yield write
+    os.unlink(path)
+
+def test_scripts_run_together():
+    results = run_scripts([row('a', 'echo a'), row('fail', 'echo no; exit 3')])
+    assert results['a']['code'] == 0 and results['a']['output'] == 'a' and results['a']['age'] == 0
+    assert results['fail']['code'] == 3 and results['fail']['output'] == 'no'
+
+def test_invalid_interval_only_fails_its_tag():
+    results = run_scripts([row('ok', 'echo hi'), row('badint', 'echo x', 'abc'), row('zero', 'echo y', '0'),
+                           row('sched', 'echo s', '60')])
+    assert list(results) == ['ok', 'badint', 'zero', 'sched']
+    assert results['ok']['code'] == 0 and results['ok']['output'] == 'hi'
+    assert results['badint']['code'] is None
+    assert results['badint']['error'] == "zbx_customScriptMonitor.conf: tag 'badint', invalid interval 'abc', expected seconds"
+    assert "invalid interval '0'" in results['zero']['error']
+    #scheduled rows are read from the scheduler's results, not run
+    assert results['sched']['output'] == '' and "zbx_scheduler.py" in results['sched']['error']
+
+def test_slow_script_is_killed():
+    results = run_scripts([row('slow', 'sleep 5'), row('ok', 'echo ok')], timeout=0.3)
+    assert results['slow']['code'] is None and results['slow']['error'] == "killed after 0.3s"
+    assert results['ok']['code'] == 0
+
+def test_scheduler_keeps_the_valid_rows(config):
+    config("ok;echo ok;high;30", "badint;echo x;high;abc", "plain;echo p;high")
+    scheduler = zbx_scheduler.Scheduler()
+    scheduler.load_config(0.0)
+    assert sorted(scheduler.jobs) == ['ok']
+    assert scheduler.jobs['ok'].interval == 30.0
+    assert scheduler.invalid == set(['badint'])
+    #a later edit still takes effect while the invalid row stays
+    config("ok;echo ok;high;30", "badint;echo x;high;abc", "more;echo m;high;10")
+    scheduler.load_config(0.0)
+    assert sorted(scheduler.jobs) == ['more', 'ok']
@@ -0,0 +1,119 @@
+#moncheck[url] against a local http.server stand-in
+
+import threading
+import http.server
+
+import pytest
+
+import zbx_urlcheck
+from zbx_dns import DnsCache
+
+BODY = b'<html>status: UP</html>' + b'x' * 4000
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append((self.client_address[1], self.command, self.path, dict(self.headers)))
+        status = int(self.path.strip('/').split('/')[0]) if self.path.strip('/').isdigit() else 200
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def do_HEAD(self):
+        self.server.requests.append((self.client_address[1], self.command, self.path, dict(self.headers)))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.requests = []
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def base(server):
+    return 'http://127.0.0.1:%d' % server.server_address[1]
+
+def row(tag, url, servername='-', probe='', match=''):
+    return {'{#TAG}': tag, '{#URL}': url, '{#SERVERNAME}': servername, '{#SEVERITY}': 'HIGH',
+            '{#PROBE}': probe, '{#MATCH}': match}
+
+def check(rows, **kwargs):
+    return zbx_urlcheck.check_urls(rows, dns=DnsCache(persistent=False), **kwargs)
+
+def test_status_and_phases(server):
+    checks = check([row('ok', base(server) + '/'), row('missing', base(server) + '/404')])
+    assert checks['ok']['status'] == 200
+    assert checks['ok']['bytes'] == len(BODY)
+    assert checks['ok']['error'] == ''
+    for phase in ('dns', 'connect', 'tls', 'ttfb', 'ms'):
+        assert checks['ok'][phase] is not None
+    assert checks['ok']['resumed'] is None and checks['ok']['cert_expires'] is None
+    assert checks['missing']['status'] == 404
+
+def test_urls_of_an_origin_share_keep_alive_connections(server, monkeypatch):
+    monkeypatch.setattr(zbx_urlcheck, 'ORIGIN_CONNECTIONS', 1)
+    checks = check([row('u%d' % i, base(server) + '/p%d' % i) for i in range(5)])
+    assert [checks['u%d' % i]['status'] for i in range(5)] == [200] * 5
+    assert len(set(port for port, _, _, _ in server.requests)) == 1
+    #only the first request of the connection connects
+    assert checks['u0']['connect'] > 0
+    assert [checks['u%d' % i]['connect'] for i in range(1, 5)] == [0.0] * 4
+
+def test_origin_connections_are_bounded(server):
+    checks = check([row('u%d' % i, base(server) + '/p%d' % i) for i in range(12)])
+    assert all(check['status'] == 200 for check in checks.values())
+    assert len(set(port for port, _, _, _ in server.requests)) == zbx_urlcheck.ORIGIN_CONNECTIONS
+
+def test_servername_is_sent_as_host(server):
+    check([row('vhost', base(server) + '/', 'shop.example.com')])
+    assert server.requests[0][3]['Host'] == 'shop.example.com:%d' % server.server_address[1]
+
+def test_match_searches_the_body(server):
+    checks = check([row('up', base(server) + '/', match='status: *UP'), row('down', base(server) + '/a', match='status: *DOWN'),
+                    row('none', base(server) + '/b')])
+    assert checks['up']['match'] == 1
+    assert checks['down']['match'] == 0
+    assert checks['none']['match'] is None
+
+def test_probes_bound_what_is_read(server):
+    checks = check([row('head', base(server) + '/h', probe='head'), row('range', base(server) + '/r', probe='range:100', match='UP'),
+                    row('get', base(server) + '/g', probe='get:10', match='UP')])
+    requests = dict((path, (method, headers)) for _, method, path, headers in server.requests)
+    assert requests['/h'][0] == 'HEAD' and checks['head']['bytes'] == 0
+    assert requests['/r'][1]['Range'] == 'bytes=0-99'
+    #the stand-in ignores Range and sends the whole body, no more than asked is read
+    assert checks['range']['bytes'] == 100 and checks['range']['match'] == 1
+    assert checks['get']['bytes'] == 10 and checks['get']['match'] == 0
+
+def test_invalid_rows_only_fail_their_tag(server):
+    checks = check([row('badurl', 'ftp://x/'), row('badprobe', base(server) + '/a', probe='range:x'),
+                    row('headmatch', base(server) + '/b', probe='head', match='UP'), row('badre', base(server) + '/c', match='('),
+                    row('ok', base(server) + '/d')])
+    assert list(checks) == ['badurl', 'badprobe', 'headmatch', 'badre', 'ok']
+    for tag in ('badurl', 'badprobe', 'headmatch', 'badre'):
+        assert checks[tag]['status'] == 0
+        assert "tag '%s'" % tag in checks[tag]['error']
+    assert checks['ok']['status'] == 200
+
+def test_refused_connection_is_reported(server):
+    import socket
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    try:
+        checks = check([row('refused', 'http://127.0.0.1:%d/' % port), row('ok', base(server) + '/')])
+    finally:
+        sock.close()
+    assert checks['refused']['status'] == 0 and checks['refused']['error'] == "Connection refused"
+    assert checks['refused']['ms'] is None
+    assert checks['ok']['status'] == 200
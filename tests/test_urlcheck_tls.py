@@ -0,0 +1,89 @@
+#TLS session reuse and certificate expiry of moncheck[url] against a local self-signed server
+
+import ssl
+import shutil
+import threading
+import subprocess
+import http.server
+
+import pytest
+
+import zbx_urlcheck
+from zbx_dns import DnsCache
+
+NAME = 'www.example.org'
+
+pytestmark = pytest.mark.skipif(shutil.which('openssl') is None, reason="needs the openssl command for a test certificate")
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope='module')
+def certificate(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('tls')
+    cert, key = str(directory / 'cert.pem'), str(directory / 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '30', '-subj', '/CN=' + NAME,
+                    '-addext', 'subjectAltName=DNS:' + NAME, '-keyout', key, '-out', cert],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert, key
+
+@pytest.fixture
+def server(certificate):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*certificate)
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+#the checker trusts the test certificate and starts without stored sessions
+@pytest.fixture(autouse=True)
+def client(certificate, monkeypatch):
+    monkeypatch.setattr(zbx_urlcheck, '_tls_context', ssl.create_default_context(cafile=certificate[0]))
+    monkeypatch.setattr(zbx_urlcheck, '_sessions', {})
+
+def rows(server, count, servername=NAME):
+    return [{'{#TAG}': 't%d' % i, '{#URL}': 'https://127.0.0.1:%d/%d' % (server.server_address[1], i),
+             '{#SERVERNAME}': servername, '{#SEVERITY}': 'HIGH'} for i in range(count)]
+
+def check(rows):
+    return zbx_urlcheck.check_urls(rows, dns=DnsCache(persistent=False))
+
+def test_connections_of_a_run_resume_the_first_session(server):
+    checks = check(rows(server, 8))
+    assert all(check['status'] == 200 for check in checks.values())
+    connections = zbx_urlcheck.ORIGIN_CONNECTIONS
+    #t0 to t3 open the connections, t4 to t7 reuse them
+    assert [checks['t%d' % i]['resumed'] for i in range(connections)] == [0] + [1] * (connections - 1)
+    assert all(checks['t%d' % i]['tls'] > 0 for i in range(connections))
+    assert all(checks['t%d' % i]['tls'] == 0.0 for i in range(connections, 8))
+
+def test_later_runs_of_the_process_resume(server):
+    check(rows(server, 1))
+    checks = check(rows(server, 2))
+    assert [check['resumed'] for check in checks.values()] == [1, 1]
+
+def test_certificate_expiry_is_reported(server, certificate):
+    end = subprocess.run(['openssl', 'x509', '-noout', '-enddate', '-in', certificate[0]],
+                         check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    expires = ssl.cert_time_to_seconds(end.strip().split('=', 1)[1])
+    checks = check(rows(server, 1))
+    assert checks['t0']['cert_expires'] == int(expires)
+
+def test_certificate_is_checked_against_servername(server):
+    checks = check(rows(server, 1, 'other.example.org'))
+    assert checks['t0']['status'] == 0
+    assert checks['t0']['resumed'] is None
+    assert "Hostname mismatch" in checks['t0']['error']
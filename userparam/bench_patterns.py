@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+#microbenchmark: plain re.match against zbx_patterns prefilters over synthetic file names
+#names are matched a directory listing at a time, the way log discovery does it
+#usage: python3 bench_patterns.py [names, default 2000000]
+
+import re
+import sys
+import time
+import random
+
+from zbx_patterns import compile_pattern
+
+PATTERNS = [
+    r'app.*\.log$',
+    r'^catalina\.out',
+    r'^catalina\.out$',
+    r'.*\.log$',
+    r'server\.log\.\d{4}-\d\d-\d\d',
+    r'.*access.*',
+]
+
+STEMS = ['app', 'application', 'catalina', 'server', 'access', 'messages', 'syslog', 'kern', 'gc', 'audit']
+EXTS = ['.log', '.out', '.gz', '.1', '.log.1', '.txt', '.xml', '']
+
+def make_names(count, seed=1):
+    rnd = random.Random(seed)
+    names = []
+    for _ in range(count):
+        name = rnd.choice(STEMS)
+        if rnd.random() < 0.5:
+            name += '-%04d' % rnd.randint(0, 9999)
+        if rnd.random() < 0.2:
+            name += '.log.%04d-%02d-%02d' % (rnd.randint(2020, 2025), rnd.randint(1, 12), rnd.randint(1, 28))
+        names.append(name + rnd.choice(EXTS))
+    return names
+
+DIR_SIZE = 500
+
+def run_plain(source, names):
+    regex = re.compile(source)
+    start = time.perf_counter()
+    hits = 0
+    for i in range(0, len(names), DIR_SIZE):
+        match = regex.match
+        hits += len([name for name in names[i:i + DIR_SIZE] if match(name)])
+    return time.perf_counter() - start, hits
+
+def run_filter(source, names):
+    pattern = compile_pattern(source)
+    start = time.perf_counter()
+    hits = 0
+    for i in range(0, len(names), DIR_SIZE):
+        hits += len(pattern.filter(names[i:i + DIR_SIZE]))
+    return time.perf_counter() - start, hits
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    names = make_names(count)
+    print("%d names" % count)
+    print("%-32s %10s %10s %8s %8s" % ("pattern", "re (s)", "filter (s)", "speedup", "hits"))
+    for source in PATTERNS:
+        plain_time, plain_hits = run_plain(source, names)
+        fast_time, fast_hits = run_filter(source, names)
+        if plain_hits != fast_hits:
+            print("%s: results differ, %d vs %d" % (source, plain_hits, fast_hits))
+            sys.exit(1)
+        print("%-32s %10.3f %10.3f %7.1fx %8d" % (source, plain_time, fast_time, plain_time / fast_time, fast_hits))
+
+if __name__ == '__main__':
+    main()
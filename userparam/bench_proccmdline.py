@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+#cmdline rule matching over rule count and process count
+#compares zbx_proc.match_processes with trying every cmdline regex on every process, on
+#synthetic JVM hosts whose services differ only in their -Dapp.name argument; a third of
+#the processes are JVMs, the rest are ordinary daemons no rule matches
+#usage: python3 bench_proccmdline.py
+
+import re
+import time
+
+import zbx_proc
+
+RULE_COUNTS = [10, 50, 200]
+PROCESS_COUNTS = [500, 2000, 8000]
+ROUNDS = 5
+
+def make_processes(count, services):
+    processes = []
+    for pid in range(1, count + 1):
+        if pid % 3 == 0:
+            service = pid % services
+            argv = ['/usr/lib/jvm/java-17/bin/java', '-Xms512m', '-Xmx2g', '-XX:+UseG1GC',
+                    '-Dapp.name=service%03d' % service, '-Dlog.dir=/var/log/service%03d' % service,
+                    '-jar', '/opt/service%03d/lib/app.jar' % service]
+            name = 'java'
+        else:
+            argv = ['/usr/sbin/daemon%d' % (pid % 40), '--config', '/etc/daemon%d.conf' % (pid % 40), '-f']
+            name = 'daemon%d' % (pid % 40)
+        processes.append((pid, name, 0, 'S', 0, 0, 0, 0, 1, argv))
+    return processes
+
+def make_rows(count):
+    return [{'{#TAG}': 'svc%d' % index, '{#PROCESS}': '', '{#USER}': '',
+             '{#CMDLINE}': r'-Dapp\.name=service%03d\b' % index} for index in range(count)]
+
+#every regex on every process, the command line joined once per regex
+def naive(rows, processes):
+    rules = [(row['{#TAG}'], re.compile(row['{#CMDLINE}'])) for row in rows]
+    matches = dict((tag, []) for tag, regex in rules)
+    for tag, regex in rules:
+        for process in processes:
+            if regex.search(' '.join(process[zbx_proc.CMDLINE])):
+                matches[tag].append(process)
+    return matches
+
+def best(function, *args):
+    times = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    print("%-8s %-10s %12s %12s %9s" % ("rules", "processes", "naive ms", "combined ms", "speedup"))
+    for rule_count in RULE_COUNTS:
+        rows = make_rows(rule_count)
+        for process_count in PROCESS_COUNTS:
+            processes = make_processes(process_count, rule_count * 2)
+            naive_time, expected = best(naive, rows, processes)
+            combined_time, result = best(zbx_proc.match_processes, rows, processes)
+            assert result == expected
+            print("%-8d %-10d %12.2f %12.2f %8.1fx" % (rule_count, process_count, naive_time * 1000,
+                                                       combined_time * 1000, naive_time / combined_time))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+
+#/proc read volume of N process checks firing in the same second, with and without the
+#shared snapshot of zbx_proc.take_snapshot()
+#every caller is a separate python, like agent pollers; each reports the /proc scans it
+#did itself and the read syscalls and bytes of its snapshot call (from /proc/self/io)
+#usage: python3 bench_procsnapshot.py [max callers, default 16]
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CALLER = '''
+import sys, time
+import zbx_proc
+#modules take_snapshot() imports on first use, so their reads are not counted
+import fcntl, marshal, tempfile
+
+def io():
+    with open('/proc/self/io') as f:
+        return dict((k, int(v)) for k, v in (line.split(':') for line in f))
+
+scans = []
+scan = zbx_proc.scan
+zbx_proc.scan = lambda: scans.append(1) or scan()
+start_at, ttl = float(sys.argv[1]), float(sys.argv[2])
+time.sleep(max(0, start_at - time.time()))
+before = io()
+started = time.perf_counter()
+zbx_proc.take_snapshot(ttl)
+elapsed = time.perf_counter() - started
+after = io()
+print(len(scans), after['syscr'] - before['syscr'], after['rchar'] - before['rchar'], elapsed)
+'''
+
+def run(callers, ttl, path):
+    if os.path.exists(path):
+        os.unlink(path)
+    env = dict(os.environ, ZBX_PROC_SNAPSHOT=path)
+    start_at = time.time() + 0.5 + 0.02 * callers
+    procs = [subprocess.Popen([sys.executable, '-c', CALLER, str(start_at), str(ttl)], cwd=HERE, env=env,
+                              stdout=subprocess.PIPE, universal_newlines=True)
+             for _ in range(callers)]
+    results = [proc.communicate()[0].split() for proc in procs]
+    scans = sum(int(r[0]) for r in results)
+    reads = sum(int(r[1]) for r in results)
+    read_bytes = sum(int(r[2]) for r in results)
+    slowest = max(float(r[3]) for r in results)
+    return scans, reads, read_bytes, slowest
+
+def main():
+    max_callers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    processes = len([name for name in os.listdir('/proc') if name.isdigit()])
+    print("%d processes in /proc" % processes)
+    print("%-8s %-9s %6s %12s %12s %12s" % ("callers", "snapshot", "scans", "read calls", "read KiB", "slowest ms"))
+    tmpdir = tempfile.mkdtemp(prefix='zbx_bench_')
+    path = os.path.join(tmpdir, 'zbx_proc.snapshot')
+    try:
+        callers = 1
+        while callers <= max_callers:
+            for label, ttl in (("off", 0), ("on", 2.0)):
+                scans, reads, read_bytes, slowest = run(callers, ttl, path)
+                print("%-8d %-9s %6d %12d %12.1f %12.1f" % (callers, label, scans, reads, read_bytes / 1024.0, slowest * 1000))
+            callers *= 2
+    finally:
+        for name in os.listdir(tmpdir):
+            os.unlink(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+if __name__ == '__main__':
+    main()
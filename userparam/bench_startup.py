@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+
+#cold start benchmark for the mondiscover entry points
+#runs every script with python -X importtime and reports what its own imports cost after
+#the interpreter's startup, plus the median wall time of a whole run; exits 1 when zbx_fast.py
+#goes over IMPORT_BUDGET_MS for a config type other than log
+#the scripts are byte-compiled first and run with bytecode writing allowed, as on an agent
+#whose scripts dir has its __pycache__ (see README.txt)
+#usage: python3 bench_startup.py [runs, default 20]
+
+import os
+import sys
+import time
+import subprocess
+
+SCRIPTS = ['zbx_fast.py', 'zbx_all_in_one.py', 'zbx-discovery-optimized.py']
+TYPES = ['process', 'url', 'log']
+#imports zbx_fast.py may add to a bare interpreter for the plain config types
+IMPORT_BUDGET_MS = 3.0
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENV = dict(os.environ)
+ENV.pop('PYTHONDONTWRITEBYTECODE', None)
+
+#return (import time in ms, number of modules) the script imports itself, i.e. what
+#-X importtime reports after the interpreter's own startup imports ending with site
+def import_cost(args):
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=HERE, env=ENV,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(self_us), name.rstrip()))
+    names = [name for self_us, name in rows]
+    if ' site' in names:
+        rows = rows[names.index(' site') + 1:]
+    return sum(self_us for self_us, name in rows) / 1000.0, len(rows)
+
+def wall_time(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=HERE, env=ENV,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000.0
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', HERE], env=ENV, stdout=subprocess.DEVNULL)
+    base_wall = median([wall_time(['-c', 'pass']) for _ in range(runs)])
+    print("bare interpreter: run %.1f ms" % base_wall)
+    print("%-28s %-8s %12s %8s %10s" % ("script", "type", "imports ms", "modules", "run ms"))
+    over_budget = False
+    for conf_type in TYPES:
+        for script in SCRIPTS:
+            args = [script, '-t', conf_type]
+            costs = [import_cost(args) for _ in range(runs)]
+            imports_ms = median([c[0] for c in costs])
+            modules = median([c[1] for c in costs])
+            run_ms = median([wall_time(args) for _ in range(runs)])
+            print("%-28s %-8s %12.1f %8d %10.1f" % (script, conf_type, imports_ms, modules, run_ms))
+            if script == 'zbx_fast.py' and conf_type != 'log' and imports_ms > IMPORT_BUDGET_MS:
+                over_budget = True
+    if over_budget:
+        print("zbx_fast.py is over its import budget of %.1f ms" % IMPORT_BUDGET_MS)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,15 @@
 #!/usr/bin/python3
 
 import os
+import sys
 import json
-import re
 import platform
 from abc import ABC, abstractmethod
 from typing import List, Dict
 
+from zbx_util import ConfigError, scripts_dir
+from zbx_confcache import load as load_config
+
 class OSHelper:
     @staticmethod
     def get_os_type() -> str:
@@ -14,9 +17,8 @@ class OSHelper:
     
     @staticmethod
     def get_scripts_dir() -> str:
-        base_dir = "C:/zabbix/scripts" if platform.system().upper() == "WINDOWS" else "/etc/zabbix/scripts"
-        os.makedirs(base_dir, exist_ok=True)
-        return base_dir
+        #ZBX_SCRIPTS_DIR overrides the per-OS default, like everywhere else
+        return scripts_dir()
 
 class ConfigParser(ABC):
     def __init__(self, config_file: str, default_content: str):
@@ -32,18 +34,32 @@ class ConfigParser(ABC):
             with open(config_path, 'w') as f:
                 f.write(self.default_content)
     
-    def read_config(self) -> List[Dict]:
+    @staticmethod
+    def config_lines(f) -> List[str]:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    
+    def read_lines(self) -> List[str]:
         self.ensure_config_exists()
-        result = []
         
         with open(self.get_config_path(), 'r') as f:
-            for line in f:
-                if line.strip() and not line.startswith('#'):
-                    parsed = self.parse_line(line.strip())
-                    if parsed:
-                        result.extend(parsed)
+            return self.config_lines(f)
+    
+    def load(self, parse):
+        #parsed once per config change, see zbx_confcache.py
+        return load_config(self.get_config_path(), self.default_content, parse, 'parser')
+    
+    def read_config(self) -> List[Dict]:
+        def parse(f):
+            result = []
+            
+            for line in self.config_lines(f):
+                parsed = self.parse_line(line)
+                if parsed:
+                    result.extend(parsed)
+            
+            return result
         
-        return result
+        return self.load(parse)
     
     @abstractmethod
     def parse_line(self, line: str) -> List[Dict]:
@@ -51,6 +67,13 @@ class ConfigParser(ABC):
     
     def output_json(self):
         print(json.dumps(self.read_config()), end="")
+    
+    #item values for a master item, for the config types that have a check mode
+    def check(self) -> Dict:
+        raise ConfigError("%s has no check mode" % self.config_file)
+    
+    def output_check_json(self):
+        print(json.dumps(self.check()), end="")
 
 class LogParser(ConfigParser):
     def __init__(self):
@@ -59,43 +82,47 @@ class LogParser(ConfigParser):
             "#tag;path;regex_filename;keyword;severity\n"
         )
     
+    def read_config(self) -> List[Dict]:
+        from zbx_logdiscovery import discover
+        #lines sharing a path are planned together, each path is walked once
+        rules = self.load(lambda f: [parts for parts in (line.split(';') for line in self.config_lines(f)) if len(parts) == 5])
+        return discover(rules)
+    
     def parse_line(self, line: str) -> List[Dict]:
         parts = line.split(';')
         if len(parts) != 5:
             return []
-            
-        tag, path, filename, keyword, level = parts
-        result = []
-        file_pattern = re.compile(filename)
-        
-        for root, _, files in os.walk(path):
-            for file in files:
-                if file_pattern.match(file):
-                    result.append({
-                        "{#TAG}": tag,
-                        "{#PATH}": os.path.join(root, file),
-                        "{#KEYWORD}": keyword,
-                        "{#SEVERITY}": level.upper()
-                    })
-                
-        return result
+        from zbx_logdiscovery import discover
+        from zbx_walker import Walker
+        return discover([parts], Walker())
 
 class ProcessParser(ConfigParser):
     def __init__(self):
         super().__init__(
             "zbx_processMonitor.conf",
-            "#tag;process;user;count;severity\n"
+            "#process: name, '-' = any; user: '-' = any\n"
+            "#cmdline: optional, regex searched in the command line, e.g. -Dapp\\.name=billing\\b\n"
+            "#tag;process;user;count;severity;cmdline\n"
         )
     
     def parse_line(self, line: str) -> List[Dict]:
-        tag, process, user, count, level = line.split(';')
-        return [{
+        parts = line.split(';')
+        tag, process, user, count, level = parts[:5] if len(parts) == 6 else parts
+        row = {
             '{#TAG}': tag,
-            '{#PROCESS}': process,
+            '{#PROCESS}': '' if process == '-' else process,
             '{#USER}': '' if user == '-' else user,
             '{#COUNT}': count,
             '{#SEVERITY}': level.upper()
-        }]
+        }
+        if len(parts) == 6:
+            row['{#CMDLINE}'] = parts[5]
+        return [row]
+    
+    def check(self) -> Dict:
+        #all config lines are evaluated in one pass over /proc
+        from zbx_proc import process_metrics
+        return process_metrics(self.read_config())
 
 class ServiceParser(ConfigParser):
     def __init__(self):
@@ -127,6 +154,11 @@ class TCPPortParser(ConfigParser):
             '{#PORT}': port,
             '{#SEVERITY}': level.upper()
         }]
+    
+    def check(self) -> Dict:
+        #all endpoints are connected to at the same time
+        from zbx_netcheck import check_ports
+        return check_ports(self.read_config())
 
 class EventLogParser(ConfigParser):
     def __init__(self):
@@ -154,32 +186,55 @@ class CustomScriptParser(ConfigParser):
     def __init__(self):
         super().__init__(
             "zbx_customScriptMonitor.conf",
-            "#tag;script;severity\n"
+            "#interval: optional, seconds between runs by zbx_scheduler.py, '-' = run on every moncheck call\n"
+            "#tag;script;severity;interval\n"
         )
     
     def parse_line(self, line: str) -> List[Dict]:
-        tag, command, level = line.split(';')
-        return [{
+        parts = line.split(';')
+        tag, command, level = parts[:3] if len(parts) == 4 else parts
+        row = {
             '{#TAG}': tag,
             '{#SCRIPT}': command,
             '{#SEVERITY}': level.upper()
-        }]
+        }
+        if len(parts) == 4:
+            row['{#INTERVAL}'] = parts[3]
+        return [row]
+
+    def check(self) -> Dict:
+        #all scripts run at the same time, one slow script does not hold the others
+        from zbx_scriptrun import run_scripts
+        return run_scripts(self.read_config())
 
 class URLParser(ConfigParser):
     def __init__(self):
         super().__init__(
             "zbx_urlMonitor.conf",
-            "#tag;url;servername;severity\n"
+            "#probe: optional, get (default), head, range:<bytes> or get:<bytes>, the body bytes read at most\n"
+            "#match: optional, regex searched in the body read, e.g. \"status\": *\"UP\"\n"
+            "#tag;url;servername;severity;probe;match\n"
         )
     
     def parse_line(self, line: str) -> List[Dict]:
-        tag, url, servername, level = line.split(';')
-        return [{
+        parts = line.split(';')
+        tag, url, servername, level = parts[:4] if len(parts) in (5, 6) else parts
+        row = {
             '{#TAG}': tag,
             '{#URL}': url,
             '{#SERVERNAME}': servername,
             '{#SEVERITY}': level.upper()
-        }]
+        }
+        if len(parts) >= 5:
+            row['{#PROBE}'] = parts[4]
+        if len(parts) == 6:
+            row['{#MATCH}'] = parts[5]
+        return [row]
+
+    def check(self) -> Dict:
+        #the urls of one origin share a keep-alive connection, origins are checked at the same time
+        from zbx_urlcheck import check_urls
+        return check_urls(self.read_config())
 
 class FileCountParser(ConfigParser):
     def __init__(self):
@@ -217,11 +272,21 @@ def main():
     parser.add_argument('-t', '--conf_type', required=True, 
                        choices=list(parsers.keys()),
                        help="config type: " + "/".join(parsers.keys()))
+    parser.add_argument('-m', '--mode', default='discovery', choices=['discovery', 'check'],
+                       help="discovery rows (default) or check values")
     
     args = parser.parse_args()
     parser_class = parsers.get(args.conf_type)
     if parser_class:
-        parser_class().output_json()
+        try:
+            if args.mode == 'check':
+                parser_class().output_check_json()
+            else:
+                parser_class().output_json()
+        except ConfigError as e:
+            #the item turns unsupported with this text instead of a traceback
+            sys.stderr.write("%s\n" % e)
+            exit(1)
     else:
         parser.print_help()
         exit(1)
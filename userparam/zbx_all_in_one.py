@@ -1,79 +1,55 @@
 #!/usr/bin/python3
 
 import os
-import json
-import re
+import sys
 
-#check running OS type, return 'Linux' or 'Windows' or 'UNIX'
-def check_os():
-    import platform
-    os_type = platform.system()
-    return os_type.upper()
+#configs are split once per change and the rows kept in the cache dir
+from zbx_confcache import load as load_config
 
-#check if /etc/zabbix/scripts exists, if not, create it
+#return the zabbix scripts dir with a trailing separator, created when missing
+#zbx_util.scripts_dir decides which one, ZBX_SCRIPTS_DIR overrides the per-OS default
 def check_dir():
-    os_type = check_os()
-    #check zabbix scripts dir exists according to OS type
-    if check_os() == 'WINDOWS':
-        if not os.path.isdir("C:\\zabbix\\scripts"):
-            os.mkdir("C:\\zabbix\\scripts")
-        return "C:\\zabbix\\scripts\\"
-    else:
-        return "/etc/zabbix/scripts/"
+    from zbx_util import scripts_dir
+    return os.path.join(scripts_dir(), '')
 
 #parse log monitor config file
-def parse_config_log():
+#a resident process passes its own dircache to keep directory listings in memory
+def parse_config_log(dircache=None):
+    from zbx_logdiscovery import discover
     scripts_dir = check_dir()
-    result = []
     file_path = scripts_dir + "zbx_logMonitor.conf"
-    #check whether the file exists, create it if not
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            file.write("#tag;path;regex_filename;keyword;severity\n")
-    with open(file_path, 'r') as f:
+    def parse(f):
+        rules = []
         for line in f:
             if not line.strip() or line.strip().startswith("#"):
                 continue
 
             parts = line.strip().split(';')
             if len(parts) == 5:
-                tag, path, filename, keyword, level = parts
-                #find all files which matches filename regex pattern in the path
-                files = []
-                filePattern = re.compile(filename)
-                for root, dirs, filenames in os.walk(path):
-                    for file in filenames:
-                        if filePattern.match(file):
-                            files.append(os.path.join(root, file))
-                for file in files:
-                    entry = {
-                        "{#TAG}": tag,
-                        "{#PATH}": file,
-                        "{#KEYWORD}": keyword,
-                        "{#SEVERITY}": level.upper()
-                    }
-                    result.append(entry)
+                rules.append(parts)
+        return rules
+    rules = load_config(file_path, "#tag;path;regex_filename;keyword;severity\n", parse, 'rules')
 
-    json_data = json.dumps(result)
-    print(json_data, end="")
+    #every path is walked once for all lines sharing it, directory listings are cached
+    #between runs and only changed directories are listed again
+    #raises zbx_util.ConfigError for a line that cannot be used
+    return discover(rules, dircache=dircache)
 
 
 #parse process monitor config file
 def parse_config_process():
-    scripts_dir = check_dir()
-    result = []
-    file_path = scripts_dir + "zbx_processMonitor.conf"
-    #check whether the file exists, create it if not
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            file.write("#tag;process;user;count;severity\n")
-    with open(file_path, 'r') as f:
+    file_path = check_dir() + "zbx_processMonitor.conf"
+    def parse(f):
+        result = []
         for line in f:
             if not line.strip() or line.strip().startswith("#"):
                 continue
 
             parts = line.strip().split(';')
-            tag, process, user, count, level = parts
+            #the cmdline column is optional
+            tag, process, user, count, level = parts[:5] if len(parts) == 6 else parts
+            if process == '-':
+                process = ''
             if user == '-':
                 user = ''
             entry = {
@@ -83,22 +59,19 @@ def parse_config_process():
                 '{#COUNT}': count,
                 '{#SEVERITY}': level.upper()
             }
+            if len(parts) == 6:
+                entry['{#CMDLINE}'] = parts[5]
             result.append(entry)
-
-    json_data = json.dumps(result)
-
-    print(json_data, end="")
+        return result
+    return load_config(file_path, ("#process: name, '-' = any; user: '-' = any\n"
+                                    "#cmdline: optional, regex searched in the command line, e.g. -Dapp\\.name=billing\\b\n"
+                                    "#tag;process;user;count;severity;cmdline\n"), parse, 'rows')
 
 #parse windows service monitor config file
 def parse_config_service():
-    scripts_dir = check_dir()
-    result = []
-    file_path = scripts_dir + "zbx_serviceMonitor.conf"
-    #check whether the file exists, create it if not
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            file.write("#tag;service;severity\n")
-    with open(file_path, 'r') as f:
+    file_path = check_dir() + "zbx_serviceMonitor.conf"
+    def parse(f):
+        result = []
         for line in f:
             if not line.strip() or line.strip().startswith("#"):
                 continue
@@ -111,21 +84,14 @@ def parse_config_service():
                 '{#SEVERITY}': level.upper()
             }
             result.append(entry)
-
-    json_data = json.dumps(result)
-
-    print(json_data, end="")
+        return result
+    return load_config(file_path, "#tag;service;severity\n", parse, 'rows')
 
 #parse windows tcp port monitor config file
 def parse_config_tcpport():
-    scripts_dir = check_dir()
-    result = []
-    file_path = scripts_dir + "zbx_networkMonitor.conf"
-    #check whether the file exists, create it if not
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            file.write("#tag;hostname;port;severity\n")
-    with open(file_path, 'r') as f:
+    file_path = check_dir() + "zbx_networkMonitor.conf"
+    def parse(f):
+        result = []
         for line in f:
             if not line.strip() or line.strip().startswith("#"):
                 continue
@@ -139,24 +105,14 @@ def parse_config_tcpport():
                 '{#SEVERITY}': level.upper()
             }
             result.append(entry)
-
-    json_data = json.dumps(result)
-
-    print(json_data, end="")
+        return result
+    return load_config(file_path, "#tag;hostname;port;severity\n", parse, 'rows')
 
 #parse windows eventlog monitor config file
 def parse_config_eventlog():
-    scripts_dir = check_dir()
-    result = []
-    file_path = scripts_dir + "zbx_eventlogMonitor.conf"
-    #check whether the file exists, create it if not
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            file.write("#logfile: Application, System, Security\n")
-            file.write("#level: Error, Warning, Critical, Information, SuccessAudit, FailureAudit\n")
-            file.write("#severity: warning, critical, fatal\n")
-            file.write("#tag;logfile;keyword;level;source;eventid;severity\n")
-    with open(file_path, 'r') as f:
+    file_path = check_dir() + "zbx_eventlogMonitor.conf"
+    def parse(f):
+        result = []
         for line in f:
             if not line.strip() or line.strip().startswith("#"):
                 continue
@@ -173,72 +129,68 @@ def parse_config_eventlog():
                 '{#SEVERITY}': severity.upper() #warning, critical, fatal
             }
             result.append(entry)
-
-    json_data = json.dumps(result)
-
-    print(json_data, end="")
+        return result
+    return load_config(file_path, ("#logfile: Application, System, Security\n"
+                                    "#level: Error, Warning, Critical, Information, SuccessAudit, FailureAudit\n"
+                                    "#severity: warning, critical, fatal\n"
+                                    "#tag;logfile;keyword;level;source;eventid;severity\n"), parse, 'rows')
 
 def parse_config_customscript():
-    scripts_dir = check_dir()
-    result = []
-    file_path = scripts_dir + "zbx_customScriptMonitor.conf"
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            file.write("#tag;script;severity\n")
-    with open(file_path, 'r') as f:
+    file_path = check_dir() + "zbx_customScriptMonitor.conf"
+    def parse(f):
+        result = []
         for line in f:
             if not line.strip() or line.strip().startswith("#"):
                 continue
 
             parts = line.strip().split(';')
-            tag, command, level = parts
+            #the interval column is optional
+            tag, command, level = parts[:3] if len(parts) == 4 else parts
             entry = {
                 '{#TAG}': tag,
                 '{#SCRIPT}': command,
                 '{#SEVERITY}': level.upper()
             }
+            if len(parts) == 4:
+                entry['{#INTERVAL}'] = parts[3]
             result.append(entry)
-
-    json_data = json.dumps(result)
-
-    print(json_data, end="")
+        return result
+    return load_config(file_path, ("#interval: optional, seconds between runs by zbx_scheduler.py, '-' = run on every moncheck call\n"
+                                    "#tag;script;severity;interval\n"), parse, 'rows')
 
 def parse_config_url():
-    scripts_dir = check_dir()
-    result = []
-    file_path = scripts_dir + "zbx_urlMonitor.conf"
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            file.write("#tag;url;servername;severity\n")
-    with open(file_path, 'r') as f:
+    file_path = check_dir() + "zbx_urlMonitor.conf"
+    def parse(f):
+        result = []
         for line in f:
             if not line.strip() or line.strip().startswith("#"):
                 continue
 
             parts = line.strip().split(';')
-            tag, url, servername, level = parts
+            #the probe and match columns are optional
+            tag, url, servername, level = parts[:4] if len(parts) in (5, 6) else parts
             entry = {
                 '{#TAG}': tag,
                 '{#URL}': url,
                 '{#SERVERNAME}': servername,
                 '{#SEVERITY}': level.upper()
             }
+            if len(parts) >= 5:
+                entry['{#PROBE}'] = parts[4]
+            if len(parts) == 6:
+                entry['{#MATCH}'] = parts[5]
             result.append(entry)
-
-    json_data = json.dumps(result)
-
-    print(json_data, end="")
+        return result
+    return load_config(file_path, ("#probe: optional, get (default), head, range:<bytes> or get:<bytes>, the body bytes read at most\n"
+                                    "#match: optional, regex searched in the body read, e.g. \"status\": *\"UP\"\n"
+                                    "#tag;url;servername;severity;probe;match\n"), parse, 'rows')
 
 ##add directory files count monitor support
 ##2024-04-29
 def parse_config_fileCount():
-    scripts_dir = check_dir()
-    result = []
-    file_path = scripts_dir + "zbx_fileCountMonitor.conf"
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            file.write("#tag;path;regex_include;min_threshold;max_threshold;severity\n")
-    with open(file_path, 'r') as f:
+    file_path = check_dir() + "zbx_fileCountMonitor.conf"
+    def parse(f):
+        result = []
         for line in f:
             if not line.strip() or line.strip().startswith("#"):
                 continue
@@ -254,37 +206,69 @@ def parse_config_fileCount():
                 '{#SEVERITY}': level.upper()
             }
             result.append(entry)
-
-    json_data = json.dumps(result)
-
-    print(json_data, end="")
+        return result
+    return load_config(file_path, "#tag;path;regex_include;min_threshold;max_threshold;severity\n", parse, 'rows')
+
+PARSERS = {
+    'log': parse_config_log,
+    'process': parse_config_process,
+    'service': parse_config_service,
+    'eventlog': parse_config_eventlog,
+    'tcpport': parse_config_tcpport,
+    'customscript': parse_config_customscript,
+    'url': parse_config_url,
+    'filecount': parse_config_fileCount
+}
+
+#count and measure the processes of every zbx_processMonitor.conf line in one pass over /proc
+def check_process():
+    from zbx_proc import process_metrics
+    return process_metrics(parse_config_process())
+
+#connect to every zbx_networkMonitor.conf endpoint at the same time
+def check_tcpport():
+    from zbx_netcheck import check_ports
+    return check_ports(parse_config_tcpport())
+
+#request every zbx_urlMonitor.conf url, one keep-alive connection per origin
+def check_url():
+    from zbx_urlcheck import check_urls
+    return check_urls(parse_config_url())
+
+#run every zbx_customScriptMonitor.conf script at the same time
+def check_customscript():
+    from zbx_scriptrun import run_scripts
+    return run_scripts(parse_config_customscript())
+
+#-m check: item values for a master item instead of discovery rows
+CHECKS = {
+    'process': check_process,
+    'tcpport': check_tcpport,
+    'url': check_url,
+    'customscript': check_customscript
+}
 
 #add arguments support
 def main():
     import argparse
+    import json
+    from zbx_util import ConfigError
     parser = argparse.ArgumentParser()
     parser.add_argument('-t', '--conf_type', required=True, help="config type: log/process/tcpport/service(windows)/eventlog(windows)/customscript/url/filecount")
+    parser.add_argument('-m', '--mode', default='discovery', choices=['discovery', 'check'], help="discovery rows (default) or check values: " + "/".join(CHECKS))
     args = parser.parse_args()
 
-    if args.conf_type == 'log':
-        parse_config_log()
-    elif args.conf_type == 'process':
-        parse_config_process()
-    elif args.conf_type == 'service':
-        parse_config_service()
-    elif args.conf_type == 'eventlog':
-        parse_config_eventlog()
-    elif args.conf_type == 'tcpport':
-        parse_config_tcpport()
-    elif args.conf_type == 'customscript':
-        parse_config_customscript()
-    elif args.conf_type == 'url':
-        parse_config_url()
-    elif args.conf_type == 'filecount':
-        parse_config_fileCount()
-    else:
+    handlers = CHECKS if args.mode == 'check' else PARSERS
+    if args.conf_type not in handlers:
         parser.print_help()
-        exit(1)
+        sys.exit(1)
+    try:
+        result = handlers[args.conf_type]()
+    except ConfigError as e:
+        #the item turns unsupported with this text instead of a traceback
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
+    print(json.dumps(result), end="")
 
 if __name__ == '__main__':
     main()
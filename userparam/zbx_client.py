@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+
+#agent side of zbx_helper.py, kept small so the interpreter starts fast
+#    UserParameter=mondiscover[*],/usr/bin/python3 -S /etc/zabbix/scripts/zbx_client.py mondiscover $1
+#    UserParameter=moncheck[*],/usr/bin/python3 -S /etc/zabbix/scripts/zbx_client.py moncheck $1
+#    UserParameter=cust.url.check[*],/usr/bin/python3 -S /etc/zabbix/scripts/zbx_client.py url $1
+#without a running helper the request is run in this process instead
+
+import os
+import sys
+
+SOCKET_PATH = "/run/zabbix/zbx_helper.sock"
+TIMEOUT = 30
+
+#return (ok, value) from the helper, None when it is not running
+def ask_helper(args):
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    path = os.environ.get('ZBX_HELPER_SOCKET') or SOCKET_PATH
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(TIMEOUT)
+        try:
+            sock.connect(path)
+        except OSError:
+            return None
+        sock.sendall('\0'.join(args).encode('utf-8') + b'\n')
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    answer = b''.join(chunks)
+    if not answer:
+        return False, "zbx_helper.py closed the connection without an answer"
+    return answer[:1] == b'0', answer[1:].decode('utf-8')
+
+def main():
+    args = sys.argv[1:]
+    answer = ask_helper(args)
+    if answer is None:
+        import zbx_helper
+        answer = zbx_helper.handle(args)
+    ok, value = answer
+    if ok:
+        sys.stdout.write(value)
+    else:
+        sys.stderr.write(value + "\n")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+
+#compiled config cache for the zbx_*Monitor.conf files
+#the configs change maybe once a month but are read and split on every discovery call;
+#the parsed rows are kept in <cache dir>/<config>.<kind>.compiled as marshal data, keyed
+#by the config's path, size, mtime_ns and inode, so an unchanged config costs one stat
+#kind tells apart callers that parse the same config differently; the script defining the
+#parse function is part of the key too, upgraded scripts that parse differently do not get
+#rows cached by the old ones
+
+import os
+import time
+
+CACHE_VERSION = 2
+
+#a config written this recently may change again within the same mtime tick with the same
+#size, its rows are used but not cached
+RACY_WINDOW_NS = 2 * 10**9
+
+def cache_path(file_path, kind):
+    from zbx_util import cache_dir
+    return os.path.join(cache_dir(), "%s.%s.compiled" % (os.path.basename(file_path), kind))
+
+#return (path, size, mtime_ns) of the file parse is defined in, None when it has none
+def parser_key(parse):
+    try:
+        code_path = parse.__code__.co_filename
+        st = os.stat(code_path)
+    except (AttributeError, OSError):
+        return None
+    return code_path, st.st_size, st.st_mtime_ns
+
+#return parse(f) for the open config file, from the cache while the file is unchanged
+#a missing config is created with default_content first
+#parse must return marshal-able data (lists, dicts, strings, numbers)
+def load(file_path, default_content, parse, kind):
+    import marshal
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        with open(file_path, 'w') as file:
+            file.write(default_content)
+        st = os.stat(file_path)
+    key = (file_path, st.st_size, st.st_mtime_ns, st.st_ino, parser_key(parse))
+    try:
+        path = cache_path(file_path, kind)
+    except OSError:
+        #no writable cache dir, parse every time as before
+        path = None
+    if path is not None:
+        try:
+            with open(path, 'rb') as f:
+                version, cached_key, rows = marshal.loads(f.read())
+            if version == CACHE_VERSION and cached_key == key:
+                return rows
+        except (OSError, ValueError, EOFError, TypeError):
+            #no cache yet, or one written by another python
+            pass
+
+    with open(file_path, 'r') as f:
+        rows = parse(f)
+    if path is not None and time.time_ns() - st.st_mtime_ns >= RACY_WINDOW_NS:
+        from zbx_util import atomic_write
+        try:
+            atomic_write(path, marshal.dumps((CACHE_VERSION, key, rows)))
+        except OSError:
+            pass
+    return rows
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+#persistent directory listing cache for log discovery
+#a directory's mtime changes whenever an entry is added, removed or renamed in it, so a
+#directory whose mtime matches the cached one is not listed again, only stat'ed
+#DirCache.listdir is a lister for zbx_walker.Walker
+
+import os
+import time
+
+from zbx_util import cache_dir, read_json, write_json
+from zbx_walker import list_entries
+
+CACHE_FILE = "zbx_logDiscovery.cache"
+CACHE_VERSION = 3
+
+#directories modified this recently may change again within the same mtime tick,
+#their listing is kept for this run but will be taken again on the next one
+RACY_WINDOW_NS = 2 * 10**9
+
+class DirCache:
+    #persistent=False keeps the listings in memory only, for long running processes
+    def __init__(self, path=None, persistent=True):
+        self.path = (path or os.path.join(cache_dir(), CACHE_FILE)) if persistent else None
+        started = time.monotonic()
+        data = read_json(self.path, {}) if persistent else {}
+        #seconds the last read or write of the cache file took, the next save takes about as long
+        self.io_seconds = time.monotonic() - started
+        if data.get('version') != CACHE_VERSION:
+            data = {}
+        #dirpath -> [mtime_ns or None, filenames, subdirs, links, st_dev, st_ino]
+        self.entries = data.get('dirs', {})
+        #directories a deadline cut the last walk short of
+        self.cursor = data.get('cursor', [])
+        self.saved_cursor = self.cursor
+        self.seen = {}
+        self.changed = False
+
+    #list one directory like zbx_walker.scan_dir, from the cache while its mtime is unchanged
+    def listdir(self, dirpath):
+        try:
+            st = os.stat(dirpath)
+        except OSError:
+            return None
+        mtime_ns = st.st_mtime_ns
+        cached = self.entries.get(dirpath)
+        if cached is not None and cached[0] == mtime_ns:
+            files, subdirs, links = cached[1], cached[2], cached[3]
+        else:
+            listing = list_entries(dirpath)
+            if listing is None:
+                return None
+            files, subdirs, links = listing
+            self.changed = True
+            if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+                mtime_ns = None
+        self.seen[dirpath] = [mtime_ns, files, subdirs, links, st.st_dev, st.st_ino]
+        return files, subdirs, links, (st.st_dev, st.st_ino)
+
+    #the listing from the last run without touching the disk, None when there is none
+    def cached(self, dirpath):
+        entry = self.seen.get(dirpath) or self.entries.get(dirpath)
+        if entry is None:
+            return None
+        return entry[1], entry[2], entry[3], (entry[4], entry[5])
+
+    #persist what this run saw, directories that were not visited are dropped unless
+    #the walk was cut short, then the older listings are kept for the rest of the tree
+    def save(self, complete=True):
+        if not complete:
+            merged = dict(self.entries)
+            merged.update(self.seen)
+            self.seen = merged
+        if self.path and (self.changed or self.cursor != self.saved_cursor or self.seen.keys() != self.entries.keys()):
+            started = time.monotonic()
+            try:
+                write_json(self.path, {'version': CACHE_VERSION, 'dirs': self.seen, 'cursor': self.cursor})
+            except OSError:
+                pass
+            self.io_seconds = time.monotonic() - started
+        self.saved_cursor = self.cursor
+        self.commit()
+
+    #keep what this run saw for the next listdir calls
+    def commit(self):
+        self.entries = self.seen
+        self.seen = {}
+        self.changed = False
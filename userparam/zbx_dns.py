@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+#host name cache shared by the tcp port and url checks
+#every check used to resolve its host names again, a slow resolver adds seconds to each;
+#answers are kept in <cache dir>/zbx_dns.cache for ZBX_DNS_TTL seconds (default 300)
+#names are resolved concurrently, once per run; an expired answer is used right away while
+#it is refreshed, and kept for up to a day while the resolver fails
+#the resolver is a function host -> [address, ...] raising OSError, tests can pass their own
+
+import os
+import time
+import socket
+
+from zbx_util import cache_dir, read_json, write_json
+
+CACHE_FILE = "zbx_dns.cache"
+CACHE_VERSION = 1
+TTL = 300
+#an answer older than this is not used even when the resolver fails
+STALE_TTL = 86400
+#seconds to wait for names without a usable answer
+RESOLVE_TIMEOUT = 2.0
+MAX_WORKERS = 16
+
+#return the addresses of host from the system resolver, in getaddrinfo order
+def system_resolver(host):
+    addresses = []
+    for info in socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM):
+        if info[4][0] not in addresses:
+            addresses.append(info[4][0])
+    return addresses
+
+#host is an ip address already
+def is_address(host):
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+            return True
+        except (OSError, ValueError):
+            continue
+    return False
+
+#ZBX_DNS_TTL overrides TTL
+def cache_ttl():
+    try:
+        return float(os.environ['ZBX_DNS_TTL'])
+    except (KeyError, ValueError):
+        return TTL
+
+class DnsCache:
+    #persistent=False keeps the answers in memory only, for long running processes
+    def __init__(self, path=None, ttl=None, resolver=None, persistent=True):
+        self.path = (path or os.path.join(cache_dir(), CACHE_FILE)) if persistent else None
+        self.ttl = cache_ttl() if ttl is None else ttl
+        self.resolver = resolver or system_resolver
+        data = read_json(self.path, {}) if persistent else {}
+        if data.get('version') != CACHE_VERSION:
+            data = {}
+        #host -> [resolved at (epoch seconds), [addresses]]
+        self.entries = data.get('hosts', {})
+        #host -> message of the last failed lookup
+        self.errors = {}
+        #host -> seconds a check waited for its lookup in this run
+        self.waited = {}
+        self.changed = False
+        #result queues of lookups still running
+        self._pending = []
+
+    def _start(self, hosts):
+        import queue
+        import threading
+        results = queue.Queue()
+        tasks = queue.Queue()
+        for host in hosts:
+            tasks.put(host)
+
+        def work():
+            while True:
+                try:
+                    host = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.perf_counter()
+                try:
+                    addresses, error = self.resolver(host), None
+                except Exception as e:
+                    addresses, error = None, e
+                results.put((host, addresses, error, time.perf_counter() - start))
+        #daemon threads, a lookup that hangs does not keep the process alive
+        for _ in range(min(len(hosts), MAX_WORKERS)):
+            threading.Thread(target=work, daemon=True).start()
+        return results
+
+    def _collect(self, results, waiting, deadline):
+        import queue
+        while True:
+            if waiting:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            else:
+                timeout = None
+            try:
+                host, addresses, error, elapsed = results.get(timeout=timeout) if waiting else results.get_nowait()
+            except queue.Empty:
+                break
+            if host in waiting:
+                self.waited[host] = elapsed
+                waiting.discard(host)
+            if error is None and addresses:
+                self.entries[host] = [time.time(), list(addresses)]
+                self.errors.pop(host, None)
+                self.changed = True
+            else:
+                self.errors[host] = getattr(error, 'strerror', None) or str(error or "no address")
+
+    #return {host: [addresses]} for hosts; address literals are returned as they are
+    #names without a fresh answer are looked up concurrently, a name with a stale answer gets
+    #that answer without waiting; names that could not be resolved within timeout seconds are
+    #left out and their error is in self.errors
+    def resolve_all(self, hosts, timeout=RESOLVE_TIMEOUT):
+        now = time.time()
+        answers = {}
+        lookups = []
+        waiting = set()
+        for host in set(hosts):
+            self.waited.pop(host, None)
+            if is_address(host):
+                answers[host] = [host]
+                continue
+            entry = self.entries.get(host)
+            age = now - entry[0] if entry else None
+            if entry and 0 <= age < self.ttl:
+                continue
+            lookups.append(host)
+            if not entry or not 0 <= age < STALE_TTL:
+                waiting.add(host)
+        if lookups:
+            results = self._start(lookups)
+            self._collect(results, waiting, time.monotonic() + timeout)
+            self._pending.append(results)
+        now = time.time()
+        for host in set(hosts) - set(answers):
+            entry = self.entries.get(host)
+            if entry and 0 <= now - entry[0] < STALE_TTL:
+                answers[host] = entry[1]
+            elif host not in self.errors:
+                self.errors[host] = "no answer within %gs" % timeout
+        return answers
+
+    #return the addresses of host, raise socket.gaierror when there are none
+    def lookup(self, host, timeout=RESOLVE_TIMEOUT):
+        addresses = self.resolve_all([host], timeout).get(host)
+        if not addresses:
+            raise socket.gaierror(socket.EAI_NONAME, self.errors.get(host, "no address"))
+        return addresses
+
+    #socket.create_connection over the cached addresses, for http.client connections
+    def create_connection(self, address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+        host, port = address[:2]
+        error = None
+        for ip in self.lookup(host):
+            try:
+                return socket.create_connection((ip, port), timeout, source_address)
+            except OSError as e:
+                error = e
+        raise error
+
+    #write the answers, including refreshes that finished while the checks ran
+    def save(self):
+        for results in self._pending:
+            self._collect(results, set(), 0)
+        if self.path and self.changed:
+            now = time.time()
+            hosts = dict((host, entry) for host, entry in self.entries.items() if 0 <= now - entry[0] < STALE_TTL)
+            try:
+                write_json(self.path, {'version': CACHE_VERSION, 'hosts': hosts})
+            except OSError:
+                pass
+        self.changed = False
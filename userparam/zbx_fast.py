@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+
+#startup optimized entry point for mondiscover[*], same arguments and output as zbx_all_in_one.py
+#    UserParameter=mondiscover[*],/usr/bin/python3 -S /etc/zabbix/scripts/zbx_fast.py -t $1
+#    UserParameter=moncheck[*],/usr/bin/python3 -S /etc/zabbix/scripts/zbx_fast.py -t $1 -m check
+#a discovery run is over in milliseconds, so interpreter start and imports are most of its cost:
+#arguments are read without argparse, the OS is taken from sys.platform, and the rows are
+#written with the C string encoder behind json instead of importing json (and re with it)
+#each config type imports only what it needs, log discovery being the only one that needs more
+#bench_startup.py measures it against zbx_all_in_one.py and zbx-discovery-optimized.py
+
+import sys
+
+OPTIONS = {'-t': 'conf_type', '--conf_type': 'conf_type', '-m': 'mode', '--mode': 'mode'}
+
+#return {'conf_type': ..., 'mode': ...} from the arguments, None when they are anything else
+def read_args(args):
+    values = {'mode': 'discovery'}
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in OPTIONS and args:
+            values[OPTIONS[arg]] = args.pop(0)
+        elif arg.startswith('--') and '=' in arg and arg.split('=', 1)[0] in OPTIONS:
+            values[OPTIONS[arg.split('=', 1)[0]]] = arg.split('=', 1)[1]
+        elif arg[:2] in ('-t', '-m') and len(arg) > 2 and not arg.startswith('--'):
+            values[OPTIONS[arg[:2]]] = arg[2:]
+        else:
+            return None
+    if 'conf_type' not in values:
+        return None
+    return values
+
+#json.dumps(value) for what the config types return: lists and dicts of strings, numbers
+#and None; anything else goes through json
+def dumps(value):
+    try:
+        from _json import encode_basestring_ascii as encode
+    except ImportError:
+        encode = None
+
+    def dump(value):
+        if type(value) is str:
+            return encode(value)
+        if value is None:
+            return 'null'
+        if type(value) is int:
+            return int.__repr__(value)
+        if type(value) is float and value - value == 0:
+            return float.__repr__(value)
+        if type(value) is list:
+            return '[' + ', '.join([dump(v) for v in value]) + ']'
+        if type(value) is dict and all(type(k) is str for k in value):
+            return '{' + ', '.join([encode(k) + ': ' + dump(v) for k, v in value.items()]) + '}'
+        raise TypeError(type(value).__name__)
+
+    if encode is not None:
+        try:
+            return dump(value)
+        except TypeError:
+            pass
+    import json
+    return json.dumps(value)
+
+def main():
+    import zbx_all_in_one
+    args = read_args(sys.argv[1:])
+    handlers = {'discovery': zbx_all_in_one.PARSERS, 'check': zbx_all_in_one.CHECKS}.get(args and args['mode'])
+    if handlers is None or args['conf_type'] not in handlers:
+        #usage and errors come from the argparse based entry point
+        zbx_all_in_one.main()
+        return
+    try:
+        result = handlers[args['conf_type']]()
+    except ValueError as e:
+        from zbx_util import ConfigError
+        if not isinstance(e, ConfigError):
+            raise
+        #the item turns unsupported with this text instead of a traceback
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
+    sys.stdout.write(dumps(result))
+
+if __name__ == '__main__':
+    main()
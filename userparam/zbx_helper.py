@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+#resident helper answering mondiscover[*], moncheck[*] and cust.url.check[*] over a unix socket
+#every UserParameter call used to start an interpreter, import and re-read its config;
+#the helper does that once and keeps compiled regexes and the discovery cache warm
+#run as a service: /usr/bin/python3 /etc/zabbix/scripts/zbx_helper.py
+#the agent calls zbx_client.py, which runs the request in-process when the helper is down
+#
+#protocol: the client sends its arguments joined by NUL and ended by a newline, the helper
+#answers with b'0' (ok) or b'1' (error) followed by the item value and closes the connection
+
+import os
+import sys
+import json
+import threading
+
+from zbx_util import ConfigError
+
+SOCKET_PATH = "/run/zabbix/zbx_helper.sock"
+MAX_REQUEST = 65536
+
+def socket_path():
+    return os.environ.get('ZBX_HELPER_SOCKET') or SOCKET_PATH
+
+#set by serve(); log discovery then shares one DirCache, which is not safe for two walks at once
+_resident = False
+_log_lock = threading.Lock()
+_dircache = None
+
+def discover(conf_type):
+    global _dircache
+    import zbx_all_in_one
+    parse = zbx_all_in_one.PARSERS.get(conf_type)
+    if parse is None:
+        raise ConfigError("unknown config type '%s', expected one of %s" % (conf_type, "/".join(zbx_all_in_one.PARSERS)))
+    if conf_type != 'log':
+        return json.dumps(parse())
+    with _log_lock:
+        if _dircache is None and _resident:
+            from zbx_dircache import DirCache
+            _dircache = DirCache()
+        return json.dumps(parse(dircache=_dircache))
+
+def check(conf_type):
+    import zbx_all_in_one
+    run = zbx_all_in_one.CHECKS.get(conf_type)
+    if run is None:
+        raise ConfigError("no check for config type '%s', expected one of %s" % (conf_type, "/".join(zbx_all_in_one.CHECKS)))
+    return json.dumps(run())
+
+def check_url(url):
+    #url_check.py sits next to this file in the scripts dir
+    import url_check
+    return str(url_check.cached_url_status(url))
+
+COMMANDS = {
+    'mondiscover': discover,
+    'moncheck': check,
+    'url': check_url
+}
+
+#run one request, return (ok, value)
+def handle(args):
+    if not args or args[0] not in COMMANDS:
+        return False, "usage: zbx_client.py %s <argument>" % "|".join(COMMANDS)
+    command = COMMANDS[args[0]]
+    if len(args) != 2:
+        return False, "usage: zbx_client.py %s <argument>" % args[0]
+    try:
+        return True, command(args[1])
+    except ConfigError as e:
+        return False, str(e)
+    except Exception as e:
+        return False, "%s: %s" % (type(e).__name__, e)
+
+def serve(path=None):
+    global _resident
+    import socket
+    import signal
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline(MAX_REQUEST)
+            if not line:
+                return
+            args = line.rstrip(b'\n').decode('utf-8', 'replace').split('\0')
+            ok, value = handle(args)
+            try:
+                self.wfile.write((b'0' if ok else b'1') + value.encode('utf-8'))
+            except BrokenPipeError:
+                #the agent gave up on the item
+                pass
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    path = path or socket_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    #a socket left by a helper that died is removed, a live one is left alone
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            sys.stderr.write("zbx_helper.py: another helper is listening on %s\n" % path)
+            sys.exit(1)
+        except OSError:
+            os.unlink(path)
+        finally:
+            probe.close()
+
+    _resident = True
+    old_umask = os.umask(0o177)
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(old_umask)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,420 @@
+#!/usr/bin/python3
+
+#resident file index for log and filecount discovery, Linux only
+#watches the paths from zbx_logMonitor.conf and zbx_fileCountMonitor.conf with inotify,
+#keeps their directory listings in memory and writes a snapshot with the finished log
+#discovery rows; mondiscover[log] prints that snapshot instead of walking while the
+#indexer is alive and the configs have not changed since it was written
+#run as a service: /usr/bin/python3 /etc/zabbix/scripts/zbx_indexer.py
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+
+from zbx_util import ConfigError, cache_dir, scripts_dir, read_json, write_json
+from zbx_dircache import DirCache, RACY_WINDOW_NS
+from zbx_walker import Walker, DEFAULT_OPTIONS, iter_tree, list_entries
+from zbx_patterns import compile_pattern
+from zbx_logdiscovery import LOG_CONFIG, WALK_CONFIG, create_walk_config, read_rules, read_walk_options, match_trees
+
+FILECOUNT_CONFIG = "zbx_fileCountMonitor.conf"
+SNAPSHOT_FILE = "zbx_index.snapshot"
+SNAPSHOT_VERSION = 1
+
+#the snapshot mtime is refreshed this often, readers ignore it once it is 3 beats old
+HEARTBEAT = 30
+#changes are applied once no event came for SETTLE seconds, or MAX_DELAY after the first one
+SETTLE = 0.5
+MAX_DELAY = 5
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+def log(message):
+    sys.stderr.write("%s zbx_indexer: %s\n" % (time.strftime('%Y-%m-%d %H:%M:%S'), message))
+    sys.stderr.flush()
+
+#minimal inotify binding over libc
+class Inotify:
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._get_errno = ctypes.get_errno
+
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = self._get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    #return pending events as (wd, mask, cookie, name), [] when there are none
+    def read(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, size = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + size].rstrip(b'\0'))
+                offset += size
+                events.append((wd, mask, cookie, name))
+
+    def close(self):
+        os.close(self.fd)
+
+#one inotify instance for all configured paths, instances are limited per user
+#(fs.inotify.max_user_instances, 128 by default) and shared with every other program
+#a directory inside two configured paths has one watch, removed when neither needs it
+class Watches:
+    def __init__(self):
+        self.inotify = None
+        #wd -> RootIndex objects using it
+        self.owners = {}
+
+    def fileno(self):
+        return self.inotify.fd
+
+    #watch dirpath for index and return the wd; the instance is created on first use, and
+    #tried again with the next watch when that failed
+    def add(self, index, dirpath, mask):
+        if self.inotify is None:
+            self.inotify = Inotify()
+        wd = self.inotify.add_watch(dirpath, mask)
+        self.owners.setdefault(wd, set()).add(index)
+        return wd
+
+    def remove(self, index, wd):
+        owners = self.owners.get(wd)
+        if owners is None:
+            return
+        owners.discard(index)
+        if not owners:
+            del self.owners[wd]
+            self.inotify.rm_watch(wd)
+
+    #return pending events as Inotify.read does
+    def read(self):
+        if self.inotify is None:
+            return []
+        events = self.inotify.read()
+        for wd, mask, _, _ in events:
+            if mask & IN_IGNORED:
+                #the directory is gone, its watch with it
+                self.owners.pop(wd, None)
+        return events
+
+#index of one configured path, its directories watched through the shared Watches
+class RootIndex:
+    def __init__(self, root, options, watches):
+        self.root = root
+        self.options = options
+        self.cache = DirCache(persistent=False)
+        self.watches = watches
+        #dirpath -> (filenames, subdirectories descended into), as RootWalk.tree
+        self.tree = {}
+        self.wds = {}
+        self.watched = {}
+        self.dirty = set()
+        self.rescan_needed = True
+        self.complete = False
+        self.first_event = None
+        self.last_event = None
+
+    def rescan(self):
+        walk = Walker(lister=self.cache.listdir).scan([self.root], {self.root: self.options})[self.root]
+        self.cache.commit()
+        self.tree = walk.tree
+        self.rescan_needed = False
+        self.dirty.clear()
+        self.sync_watches()
+
+    def sync_watches(self):
+        for dirpath in [d for d in self.watched if d not in self.tree]:
+            wd = self.watched.pop(dirpath)
+            self.wds.pop(wd, None)
+            self.watches.remove(self, wd)
+        mask = WATCH_MASK if self.options.follow_symlinks else WATCH_MASK | IN_DONT_FOLLOW
+        self.complete = True
+        for dirpath in self.tree:
+            if dirpath in self.watched:
+                continue
+            try:
+                wd = self.watches.add(self, dirpath, mask)
+            except OSError as e:
+                if e.errno == errno.ENOSPC and self.complete:
+                    log("%s: out of inotify watches, raise fs.inotify.max_user_watches" % self.root)
+                elif self.watches.inotify is None and self.complete:
+                    log("%s: no inotify instance (%s), raise fs.inotify.max_user_instances" % (self.root, e.strerror or e))
+                self.complete = False
+                continue
+            self.wds[wd] = dirpath
+            self.watched[dirpath] = wd
+            #anything that changed between the listing and the watch is caught by a second look
+            self.dirty.add(dirpath)
+
+    #take the events of this path from events, a queue overflow concerns every path
+    def handle_events(self, events):
+        now = time.monotonic()
+        for wd, mask, _, _ in events:
+            if mask & IN_Q_OVERFLOW:
+                self.rescan_needed = True
+                self.first_event = self.first_event or now
+                self.last_event = now
+                continue
+            dirpath = self.wds.get(wd)
+            if dirpath is None:
+                continue
+            self.first_event = self.first_event or now
+            self.last_event = now
+            if mask & IN_IGNORED:
+                del self.wds[wd]
+                self.watched.pop(dirpath, None)
+                self.rescan_needed = True
+            elif mask & (IN_ISDIR | IN_DELETE_SELF | IN_MOVE_SELF):
+                self.rescan_needed = True
+            else:
+                self.dirty.add(dirpath)
+
+    #True when changes are waiting and events have settled
+    def due(self, now):
+        if not (self.rescan_needed or self.dirty):
+            return False
+        if self.last_event is None:
+            return True
+        return now - self.last_event >= SETTLE or now - self.first_event >= MAX_DELAY
+
+    #apply pending changes, return True when the index changed
+    def update(self):
+        self.first_event = self.last_event = None
+        changed = False
+        for dirpath in sorted(self.dirty):
+            if self.rescan_needed:
+                break
+            changed = self.refresh(dirpath) or changed
+        self.dirty.clear()
+        if self.rescan_needed:
+            old_tree = self.tree
+            self.rescan()
+            changed = changed or self.tree != old_tree
+        return changed
+
+    #list one directory again after file events, a changed set of subdirectories needs a rescan
+    def refresh(self, dirpath):
+        old = self.cache.entries.get(dirpath)
+        try:
+            mtime_ns = os.stat(dirpath).st_mtime_ns
+        except OSError:
+            self.rescan_needed = True
+            return False
+        if old is not None and old[0] == mtime_ns:
+            return False
+        listing = list_entries(dirpath)
+        if listing is None or old is None or dirpath not in self.tree:
+            self.rescan_needed = True
+            return False
+        files, subdirs, links = listing
+        if subdirs != old[2] or links != old[3]:
+            self.rescan_needed = True
+            return False
+        if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+            mtime_ns = None
+        self.cache.entries[dirpath] = [mtime_ns, files, subdirs, links, old[4], old[5]]
+        if files == self.tree[dirpath][0]:
+            return False
+        self.tree[dirpath] = (files, self.tree[dirpath][1])
+        return True
+
+    def close(self):
+        for wd in list(self.wds):
+            self.watches.remove(self, wd)
+        self.wds.clear()
+        self.watched.clear()
+
+#(mtime_ns, size) of every config the snapshot depends on
+def config_signature():
+    signature = {}
+    for name in (LOG_CONFIG, WALK_CONFIG, FILECOUNT_CONFIG):
+        try:
+            st = os.stat(os.path.join(scripts_dir(), name))
+            signature[name] = [st.st_mtime_ns, st.st_size]
+        except OSError:
+            signature[name] = None
+    return signature
+
+#read zbx_fileCountMonitor.conf into [tag, path, regex_include] rules
+def read_filecount_rules():
+    rules = []
+    try:
+        with open(os.path.join(scripts_dir(), FILECOUNT_CONFIG), 'r') as f:
+            for line in f:
+                if not line.strip() or line.strip().startswith("#"):
+                    continue
+                parts = line.strip().split(';')
+                if len(parts) == 6:
+                    rules.append(parts[:3])
+    except OSError:
+        pass
+    return rules
+
+class Indexer:
+    def __init__(self):
+        self.path = os.path.join(cache_dir(), SNAPSHOT_FILE)
+        self.roots = {}
+        self.log_rules = []
+        self.filecount_rules = []
+        self.signature = None
+        self.watches = Watches()
+
+    def load_config(self):
+        #read_walk_options would create a missing walk config after the signature was taken
+        create_walk_config()
+        signature = config_signature()
+        try:
+            log_rules = read_rules()
+            options = read_walk_options()
+            filecount_rules = read_filecount_rules()
+        except ConfigError as e:
+            log("%s, keeping the previous config" % e)
+            self.signature = signature
+            return
+        wanted = {}
+        for rule in log_rules + filecount_rules:
+            wanted[rule[1]] = options.get(rule[1], DEFAULT_OPTIONS)
+        for root in list(self.roots):
+            if root not in wanted or self.roots[root].options.key() != wanted[root].key():
+                self.roots.pop(root).close()
+        for root, opts in wanted.items():
+            if root not in self.roots:
+                self.roots[root] = RootIndex(root, opts, self.watches)
+        self.log_rules = log_rules
+        self.filecount_rules = filecount_rules
+        self.signature = signature
+        log("watching %d paths" % len(self.roots))
+
+    def write_snapshot(self):
+        trees = dict((root, list(iter_tree(index.tree, root))) for root, index in self.roots.items())
+        filecount = {}
+        for tag, path, pattern in self.filecount_rules:
+            try:
+                compiled = compile_pattern(pattern)
+            except ConfigError:
+                continue
+            filecount[tag] = [os.path.join(dirpath, name) for dirpath, names in trees.get(path, ()) for name in compiled.filter(names)]
+        try:
+            log_rows = match_trees(self.log_rules, trees)
+            complete = all(index.complete for index in self.roots.values())
+        except ConfigError:
+            log_rows = []
+            complete = False
+        write_json(self.path, {
+            'version': SNAPSHOT_VERSION,
+            'pid': os.getpid(),
+            'complete': complete,
+            'configs': self.signature,
+            'log': log_rows,
+            'filecount': filecount
+        })
+
+    def run(self):
+        self.load_config()
+        for index in self.roots.values():
+            index.rescan()
+        self.write_snapshot()
+        last_write = time.monotonic()
+        while True:
+            try:
+                ready, _, _ = select.select([self.watches] if self.watches.inotify else [], [], [], SETTLE)
+            except InterruptedError:
+                ready = []
+            if ready:
+                events = self.watches.read()
+                if any(mask & IN_Q_OVERFLOW for _, mask, _, _ in events):
+                    log("event queue overflow, rescanning")
+                for index in self.roots.values():
+                    index.handle_events(events)
+            now = time.monotonic()
+            changed = False
+            if config_signature() != self.signature:
+                self.load_config()
+                changed = True
+            for index in self.roots.values():
+                if not index.tree and now - last_write >= HEARTBEAT:
+                    #the path did not exist yet, look again
+                    index.rescan_needed = True
+                if index.due(now):
+                    changed = index.update() or changed
+            if changed:
+                self.write_snapshot()
+                last_write = now
+            elif now - last_write >= HEARTBEAT:
+                try:
+                    os.utime(self.path)
+                except OSError:
+                    self.write_snapshot()
+                last_write = now
+
+#the snapshot when it can be trusted: written by a live indexer, recently, for the current configs
+def load_snapshot():
+    path = os.path.join(cache_dir(), SNAPSHOT_FILE)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if time.time() - st.st_mtime > 3 * HEARTBEAT:
+        return None
+    data = read_json(path)
+    if not data or data.get('version') != SNAPSHOT_VERSION or not data.get('complete'):
+        return None
+    try:
+        os.kill(data['pid'], 0)
+    except ProcessLookupError:
+        return None
+    except (OSError, KeyError, TypeError):
+        pass
+    if data.get('configs') != config_signature():
+        return None
+    return data
+
+#log discovery rows from the snapshot, None when discovery has to walk
+def load_log_rows():
+    data = load_snapshot()
+    return data['log'] if data else None
+
+def main():
+    if not sys.platform.startswith('linux'):
+        sys.stderr.write("zbx_indexer.py needs Linux inotify\n")
+        sys.exit(1)
+    Indexer().run()
+
+if __name__ == '__main__':
+    main()
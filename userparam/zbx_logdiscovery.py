@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+
+#log discovery planner shared by zbx_all_in_one.py and zbx-discovery-optimized.py
+#config lines are grouped by path, every path is walked once and each file name is
+#tested against all regex_filename patterns of that path in the same pass
+#how deep a path is walked can be limited per path in zbx_logWalk.conf
+
+import os
+import time
+
+from zbx_dircache import DirCache
+from zbx_patterns import compile_pattern, combine, PatternError
+from zbx_util import ConfigError, scripts_dir, discovery_budget
+from zbx_walker import Walker, WalkOptions
+
+#share of the budget kept after listing for filling in from the cache and matching
+FINISH_SHARE = 0.25
+
+LOG_CONFIG = "zbx_logMonitor.conf"
+WALK_CONFIG = "zbx_logWalk.conf"
+WALK_CONFIG_HEADER = (
+    "#optional walk limits for paths in zbx_logMonitor.conf, '-' keeps the default\n"
+    "#max_depth: directory levels searched below path, 0 = path only\n"
+    "#exclude_dirs: regex, matching directory names are skipped with their subtree\n"
+    "#one_filesystem: yes = do not cross into other mounts, e.g. NFS under /var/log\n"
+    "#follow_symlinks: yes = descend into symlinked directories, links back to a parent are ignored\n"
+    "#path;max_depth;exclude_dirs;one_filesystem;follow_symlinks\n"
+)
+
+#one walk of a root and the patterns to test there
+class RootPlan:
+    def __init__(self, root):
+        self.root = root
+        #regex source -> indexes of the config lines using it
+        self.patterns = {}
+
+    def add(self, pattern, index):
+        self.patterns.setdefault(pattern, []).append(index)
+
+    #return match(filenames) -> [(config line indexes, matching names), ...]
+    def matcher(self):
+        compiled = [(compile_pattern(pattern), indexes) for pattern, indexes in self.patterns.items()]
+        #a name that matches none of the patterns, the common case, is rejected by a
+        #single alternation of all of them; match() semantics are the same for both
+        combined = combine(list(self.patterns)) if len(compiled) > 1 else None
+
+        def match(names):
+            if combined is not None:
+                combined_match = combined.match
+                names = [name for name in names if combined_match(name)]
+                if not names:
+                    return ()
+            return [(indexes, pattern.filter(names)) for pattern, indexes in compiled]
+        return match
+
+#rules are [tag, path, regex_filename, keyword, severity] lists in config order
+def plan(rules):
+    plans = {}
+    for index, rule in enumerate(rules):
+        path, pattern = rule[1], rule[2]
+        try:
+            compile_pattern(pattern)
+        except PatternError as e:
+            raise PatternError("zbx_logMonitor.conf: tag '%s', regex_filename: %s" % (rule[0], e))
+        if path not in plans:
+            plans[path] = RootPlan(path)
+        plans[path].add(pattern, index)
+    return list(plans.values())
+
+#read zbx_logMonitor.conf into rules for discover()
+def read_rules(file_path=None):
+    file_path = file_path or os.path.join(scripts_dir(), LOG_CONFIG)
+    rules = []
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                if not line.strip() or line.strip().startswith("#"):
+                    continue
+                parts = line.strip().split(';')
+                if len(parts) == 5:
+                    rules.append(parts)
+    except OSError:
+        pass
+    return rules
+
+def parse_flag(value):
+    return value.strip().lower() in ('1', 'y', 'yes', 'true', 'on')
+
+#create zbx_logWalk.conf with its header when missing, return False when it was missing
+def create_walk_config(file_path=None):
+    file_path = file_path or os.path.join(scripts_dir(), WALK_CONFIG)
+    if os.path.exists(file_path):
+        return True
+    try:
+        with open(file_path, 'w') as f:
+            f.write(WALK_CONFIG_HEADER)
+    except OSError:
+        pass
+    return False
+
+#read zbx_logWalk.conf into {path: WalkOptions}, the file is created with its header when missing
+def read_walk_options(file_path=None):
+    file_path = file_path or os.path.join(scripts_dir(), WALK_CONFIG)
+    if not create_walk_config(file_path):
+        return {}
+    options = {}
+    with open(file_path, 'r') as f:
+        for line in f:
+            if not line.strip() or line.strip().startswith("#"):
+                continue
+            parts = line.strip().split(';')
+            if len(parts) != 5:
+                raise ConfigError("%s: expected path;max_depth;exclude_dirs;one_filesystem;follow_symlinks, got '%s'" % (WALK_CONFIG, line.strip()))
+            path, max_depth, exclude, one_filesystem, follow_symlinks = parts
+            opts = WalkOptions()
+            try:
+                if max_depth.strip() not in ('', '-'):
+                    opts.max_depth = int(max_depth)
+                    if opts.max_depth < 0:
+                        raise ValueError(max_depth)
+            except ValueError:
+                raise ConfigError("%s: path '%s', max_depth must be a number >= 0, got '%s'" % (WALK_CONFIG, path, max_depth))
+            if exclude not in ('', '-'):
+                try:
+                    opts.exclude = compile_pattern(exclude)
+                except PatternError as e:
+                    raise PatternError("%s: path '%s', exclude_dirs: %s" % (WALK_CONFIG, path, e))
+            opts.one_filesystem = one_filesystem != '-' and parse_flag(one_filesystem)
+            opts.follow_symlinks = follow_symlinks != '-' and parse_flag(follow_symlinks)
+            options[path] = opts
+    return options
+
+#return LLD rows for rules, in config line order and os.walk order within a line
+#raises ConfigError naming the config line when a regex or walk limit cannot be used
+#the whole call, reading and writing the cache included, takes about budget seconds
+#(default: agent Timeout less a second); listing stops early enough to leave time for the
+#rest, paths it did not finish are completed from the last known listings and continued
+#next run, so a tree the cache knows in full is never cut short
+#a resident process passes the DirCache it keeps in memory
+def discover(rules, walker=None, options=None, budget=None, dircache=None):
+    if walker is None and options is None:
+        #answered from the zbx_indexer.py snapshot while the indexer is running
+        from zbx_indexer import load_log_rows
+        rows = load_log_rows()
+        if rows is not None:
+            return rows
+    plans = plan(rules)
+    if options is None:
+        options = read_walk_options()
+    roots = [p.root for p in plans]
+    if walker is not None:
+        return match_trees(rules, walker.walk_many(roots, options), plans)
+    if budget is None:
+        budget = discovery_budget()
+    end = time.monotonic() + budget
+    dircache = dircache or DirCache()
+    walker = Walker(lister=dircache.listdir, fallback=dircache.cached)
+    #writing the cache back takes about as long as reading it did
+    deadline = end - min(budget / 2, dircache.io_seconds + budget * FINISH_SHARE)
+    trees = walker.walk_many(roots, options, deadline, dircache.cursor)
+    rows = match_trees(rules, trees, plans)
+    dircache.cursor = walker.pending
+    dircache.save(complete=not walker.pending)
+    return rows
+
+#turn walked trees {root: [(dirpath, filenames), ...]} into LLD rows for rules
+def match_trees(rules, trees, plans=None):
+    found = [[] for _ in rules]
+    for root_plan in plans or plan(rules):
+        match = root_plan.matcher()
+        for dirpath, filenames in trees.get(root_plan.root, ()):
+            for indexes, names in match(filenames):
+                for name in names:
+                    path = os.path.join(dirpath, name)
+                    for index in indexes:
+                        found[index].append(path)
+
+    result = []
+    for (tag, _, _, keyword, level), files in zip(rules, found):
+        for file in files:
+            result.append({
+                "{#TAG}": tag,
+                "{#PATH}": file,
+                "{#KEYWORD}": keyword,
+                "{#SEVERITY}": level.upper()
+            })
+    return result
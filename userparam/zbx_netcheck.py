@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+
+#tcp port check for zbx_networkMonitor.conf
+#one net.tcp.port item per endpoint runs them one after another on the agent pollers, and a
+#blackholed host holds its poller for the whole timeout; this connects to every endpoint at
+#the same time with asyncio and returns {"<tag>": {"up": 1, "ms": 0.42, ...}, ...}
+#for one master item, dependent items pick their tag
+#endpoints on this host are not connected to: on Linux their port is looked up in the
+#LISTEN sockets of /proc/net/tcp and tcp6, read once per run
+#host names are resolved through the shared cache of zbx_dns.py, all of them at once
+
+import os
+import time
+import socket
+
+from zbx_util import discovery_budget
+from zbx_dns import DnsCache, RESOLVE_TIMEOUT
+
+#seconds one connect may take
+CONNECT_TIMEOUT = 2.0
+#connects in flight at once
+CONCURRENCY = 100
+
+PROC_NET = "/proc/net"
+TCP_LISTEN = b'0A'
+
+#address in /proc/net/tcp[6] notation, 32 bit words in host byte order, to its text form
+def proc_address(text):
+    import sys
+    raw = bytes.fromhex(text.decode())
+    if sys.byteorder == 'little':
+        raw = b''.join(raw[i:i + 4][::-1] for i in range(0, len(raw), 4))
+    if len(raw) == 4:
+        return socket.inet_ntop(socket.AF_INET, raw)
+    address = socket.inet_ntop(socket.AF_INET6, raw)
+    #v4 mapped, a v4 client connects there
+    return address[7:] if address.startswith('::ffff:') and '.' in address else address
+
+#return the set of (address, port) with a listening tcp socket, None without /proc/net
+def read_listeners():
+    listeners = set()
+    found = False
+    for name in ("tcp", "tcp6"):
+        try:
+            with open(os.path.join(PROC_NET, name), 'rb') as f:
+                lines = f.read().splitlines()[1:]
+        except OSError:
+            continue
+        found = True
+        for line in lines:
+            fields = line.split()
+            if len(fields) > 3 and fields[3] == TCP_LISTEN:
+                address, port = fields[1].split(b':')
+                listeners.add((proc_address(address), int(port, 16)))
+    return listeners if found else None
+
+#return the addresses of this host: the LOCAL routes of /proc/net/fib_trie and if_inet6
+def local_addresses():
+    addresses = set(['::1'])
+    try:
+        with open(os.path.join(PROC_NET, "fib_trie"), 'r') as f:
+            previous = ''
+            for line in f:
+                if '/32 host LOCAL' in line and '|--' in previous:
+                    addresses.add(previous.split('|--')[1].strip())
+                previous = line
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(PROC_NET, "if_inet6"), 'r') as f:
+            for line in f:
+                raw = bytes.fromhex(line.split()[0])
+                addresses.add(socket.inet_ntop(socket.AF_INET6, raw))
+    except (OSError, ValueError):
+        pass
+    return addresses
+
+def is_local(address, addresses):
+    return address.startswith('127.') or address in addresses
+
+#the addresses a host name resolved to all belong to this host
+def is_local_target(targets, addresses):
+    return bool(targets) and all(is_local(address, addresses) for address in targets)
+
+#return True when one of the addresses has a listener on port, False when none has,
+#None when it cannot be told: a v4 client reaching a [::] listener depends on IPV6_V6ONLY,
+#which /proc does not show
+def listening(targets, port, listeners):
+    answer = False
+    for address in targets:
+        wildcard = '0.0.0.0' if '.' in address else '::'
+        if (address, port) in listeners or (wildcard, port) in listeners:
+            return True
+        if wildcard == '0.0.0.0' and ('::', port) in listeners:
+            answer = None
+    return answer
+
+#return (up, connect ms or None, error) for one endpoint, its addresses are tried in turn
+#within timeout like net.tcp.port does
+async def probe(addresses, port, timeout, semaphore):
+    import asyncio
+    async with semaphore:
+        start = time.perf_counter()
+        error = "no address"
+        for address in addresses:
+            left = timeout - (time.perf_counter() - start)
+            if left <= 0:
+                break
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), left)
+            except asyncio.TimeoutError:
+                error = "connect timed out after %gs" % timeout
+                continue
+            except OSError as e:
+                error = os.strerror(e.errno) if e.errno else str(e)
+                continue
+            elapsed = time.perf_counter() - start
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+            return 1, round(elapsed * 1000, 2), ''
+        return 0, None, error
+
+#connect to all endpoints, {(host, port): addresses}, return {(host, port): (up, ms, error)}
+#endpoints still connecting after deadline seconds are reported down
+async def probe_all(endpoints, timeout, concurrency, deadline):
+    import asyncio
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = dict((asyncio.ensure_future(probe(addresses, endpoint[1], timeout, semaphore)), endpoint)
+                 for endpoint, addresses in endpoints.items())
+    if not tasks:
+        return {}
+    done, pending = await asyncio.wait(list(tasks), timeout=deadline)
+    for task in pending:
+        task.cancel()
+    results = {}
+    for task, endpoint in tasks.items():
+        if task in done:
+            results[endpoint] = task.result()
+        else:
+            results[endpoint] = (0, None, "not checked within %gs" % deadline)
+    return results
+
+#return {tag: {up, ms, error, method}} for the discovery rows of zbx_networkMonitor.conf
+#method is listen for endpoints answered from the socket tables (ms is null then) and
+#connect for the others; an endpoint used by several tags is checked once, a tag with an
+#invalid port is down with its config error
+#the whole check ends within deadline seconds, default the discovery budget
+#dns is the zbx_dns.DnsCache to resolve through, by default the one on disk
+def check_ports(rows, timeout=CONNECT_TIMEOUT, concurrency=CONCURRENCY, deadline=None, dns=None):
+    import asyncio
+    endpoints = {}
+    checks = {}
+    for row in rows:
+        try:
+            port = int(row['{#PORT}'])
+            if not 0 < port < 65536:
+                raise ValueError(port)
+        except ValueError:
+            error = "zbx_networkMonitor.conf: tag '%s', invalid port '%s'" % (row['{#TAG}'], row['{#PORT}'])
+            checks[row['{#TAG}']] = {'up': 0, 'ms': None, 'error': error, 'method': 'connect'}
+            continue
+        endpoints[row['{#TAG}']] = (row['{#HOSTNAME}'], port)
+    if deadline is None:
+        deadline = discovery_budget()
+    start = time.monotonic()
+    if dns is None:
+        dns = DnsCache()
+    resolved = dns.resolve_all([host for host, port in endpoints.values()], min(deadline / 2, RESOLVE_TIMEOUT))
+    results = {}
+    for host, port in set(endpoints.values()):
+        if host not in resolved:
+            results[(host, port)] = (0, None, dns.errors.get(host, "no address"), 'connect')
+    listeners = read_listeners()
+    if listeners is not None:
+        addresses = local_addresses()
+        for host, port in set(endpoints.values()) - set(results):
+            if is_local_target(resolved[host], addresses):
+                state = listening(resolved[host], port, listeners)
+                if state is not None:
+                    results[(host, port)] = (1, None, '', 'listen') if state else (0, None, "nothing listens on port %d" % port, 'listen')
+    remote = dict((endpoint, resolved[endpoint[0]]) for endpoint in set(endpoints.values()) - set(results))
+    if remote:
+        left = max(0.1, deadline - (time.monotonic() - start))
+        for endpoint, result in asyncio.run(probe_all(remote, min(timeout, left), concurrency, left)).items():
+            results[endpoint] = result + ('connect',)
+    dns.save()
+    for tag, endpoint in endpoints.items():
+        up, ms, error, method = results[endpoint]
+        checks[tag] = {'up': up, 'ms': ms, 'error': error, 'method': method}
+    return dict((row['{#TAG}'], checks[row['{#TAG}']]) for row in rows)
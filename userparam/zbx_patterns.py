@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+#file name pattern compiler for regex_filename / regex_include config columns
+#the literal prefix, suffix and required substrings of a regex are pulled out of its
+#parse tree and checked with startswith/endswith/in before the regex itself runs;
+#most names in a log directory are rejected by those string checks alone
+#filter() works on a whole directory listing at a time, per name function calls cost
+#more than the regex they would save
+
+import re
+
+from zbx_util import ConfigError
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+LITERAL = sre_constants.LITERAL
+AT = sre_constants.AT
+SUBPATTERN = sre_constants.SUBPATTERN
+BEGINNINGS = (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING)
+ENDINGS = (sre_constants.AT_END, sre_constants.AT_END_STRING)
+
+class PatternError(ConfigError):
+    pass
+
+class FilenamePattern:
+    def __init__(self, source):
+        self.source = source
+        try:
+            self.regex = re.compile(source)
+            tree = sre_parse.parse(source)
+        except re.error as e:
+            raise PatternError("invalid regex '%s': %s" % (source, e))
+        self.prefix = ''
+        self.suffix = ''
+        self.required = ()
+        #the prefilters decide alone when the whole pattern is literal, e.g. ^catalina\.out$
+        self.literal = False
+        self.exact = False
+        #$ also matches before a trailing newline, \Z does not
+        self.endings = ('',)
+        if not self.regex.flags & (re.IGNORECASE | re.MULTILINE):
+            self._extract(list(flatten(tree)))
+
+    def _extract(self, items):
+        runs = []
+        run = []
+        literal = True
+        for index, (op, av) in enumerate(items):
+            if op is LITERAL:
+                run.append(chr(av))
+                continue
+            if run:
+                runs.append((index - len(run), ''.join(run)))
+                run = []
+            if op is AT and av in BEGINNINGS and index == 0:
+                continue
+            if op is AT and av in ENDINGS and index == len(items) - 1:
+                continue
+            literal = False
+            runs.append((index, None))
+        if run:
+            runs.append((len(items) - len(run), ''.join(run)))
+
+        anchored_end = bool(items) and items[-1][0] is AT and items[-1][1] in ENDINGS
+        if anchored_end and items[-1][1] == sre_constants.AT_END:
+            self.endings = ('', '\n')
+        first = 1 if items and items[0][0] is AT and items[0][1] in BEGINNINGS else 0
+        required = []
+        for start, text in runs:
+            if text is None:
+                continue
+            if start == first:
+                self.prefix = text
+            elif anchored_end and start + len(text) == len(items) - 1:
+                self.suffix = text
+            else:
+                required.append(text)
+        #a literal pattern without $ is only a prefix check, with $ the prefix is the whole name
+        if literal and anchored_end and self.prefix:
+            self.suffix = ''
+        self.suffixes = tuple(self.suffix + ending for ending in self.endings)
+        self.required = tuple(sorted(set(required), key=len, reverse=True))
+        self.literal = literal
+        self.exact = literal and anchored_end
+
+    #the longest string every match contains, '' when there is none
+    def keyword(self):
+        return max((self.prefix, self.suffix) + self.required, key=len)
+
+    #return a true value when name matches the way re.match(source, name) would
+    def match(self, name):
+        prefix = self.prefix
+        if prefix and not name.startswith(prefix):
+            return None
+        if self.literal:
+            if not self.exact:
+                return True
+            return True if name[len(prefix):] in self.endings else None
+        if self.suffix and not name.endswith(self.suffixes):
+            return None
+        for text in self.required:
+            if text not in name:
+                return None
+        return self.regex.match(name)
+
+    #return the names matching the way re.match(source, name) would, in their original order
+    def filter(self, names):
+        prefix = self.prefix
+        if prefix:
+            names = [name for name in names if name.startswith(prefix)]
+        if self.literal:
+            if not self.exact:
+                return list(names)
+            size = len(prefix)
+            endings = self.endings
+            return [name for name in names if name[size:] in endings]
+        if self.suffix:
+            suffixes = self.suffixes
+            names = [name for name in names if name.endswith(suffixes)]
+        for text in self.required:
+            names = [name for name in names if text in name]
+        match = self.regex.match
+        return [name for name in names if match(name)]
+
+#build one regex matching where any of patterns matches, None when they cannot be combined
+def combine(patterns):
+    #numbered and named backreferences would point at another pattern's groups
+    if any(re.search(r'\\[1-9]|\(\?P=', pattern) for pattern in patterns):
+        return None
+    try:
+        return re.compile('|'.join('(?:%s)' % pattern for pattern in patterns))
+    except re.error:
+        #global inline flags, duplicate group names, ...
+        return None
+
+#inline the top level sequence of a parsed pattern, plain groups do not change what is required
+def flatten(tree):
+    for op, av in tree:
+        if op is SUBPATTERN and not av[1] and not av[2]:
+            for item in flatten(av[3]):
+                yield item
+        else:
+            yield op, av
+
+_cache = {}
+
+#compile source once per process, shared by every config line using it
+def compile_pattern(source):
+    pattern = _cache.get(source)
+    if pattern is None:
+        pattern = _cache[source] = FilenamePattern(source)
+    return pattern
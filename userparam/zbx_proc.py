@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+
+#process check for zbx_processMonitor.conf, Linux only
+#every proc.num[] item walks /proc on its own; this reads /proc/<pid>/stat, status and
+#cmdline once per process and evaluates all config lines in that one pass
+#the values go to one master item as {"<tag>": {"count": ..., "cpu": ...}, ...}, dependent
+#items pick their tag; CPU use is the difference to the sample the previous call kept in
+#<cache dir>/zbx_processCheck.state, so a call never sleeps to take a second sample
+#pollers calling within SNAPSHOT_TTL seconds of each other share one /proc scan through a
+#snapshot on tmpfs, see take_snapshot()
+
+import os
+import time
+
+from zbx_util import ConfigError, cache_dir, read_json, write_json
+
+PROC = "/proc"
+STATE_FILE = "zbx_processCheck.state"
+STATE_VERSION = 2
+
+#the snapshot goes to the first of these dirs that exists, both are tmpfs
+SNAPSHOT_DIRS = ["/run/zabbix", "/dev/shm"]
+SNAPSHOT_FILE = "zbx_proc.snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_TTL = 2.0
+
+#fields of a process tuple from read_process()
+PID, NAME, UID, STATE, UTIME, STIME, RSS_PAGES, START_TICKS, THREADS, CMDLINE = range(10)
+
+#the kernel keeps the first 15 bytes of a process name in stat and status
+COMM_LEN = 15
+
+#return (pid, name, effective uid, state, utime ticks, stime ticks, rss pages, start ticks,
+#threads, argv) or None for a process that exited while it was read
+def read_process(pid):
+    base = "%s/%d/" % (PROC, pid)
+    try:
+        with open(base + "stat", 'rb') as f:
+            stat = f.read()
+        with open(base + "status", 'rb') as f:
+            status = f.read()
+        with open(base + "cmdline", 'rb') as f:
+            cmdline = f.read()
+    except OSError:
+        return None
+    #the name is in parentheses and may itself contain spaces and parentheses
+    name_end = stat.rfind(b')')
+    name = stat[stat.find(b'(') + 1:name_end].decode('utf-8', 'replace')
+    fields = stat[name_end + 2:].split()
+    uid_at = status.find(b'\nUid:')
+    uid = int(status[uid_at + 5:status.find(b'\n', uid_at + 1)].split()[1]) if uid_at >= 0 else -1
+    argv = cmdline.rstrip(b'\0').decode('utf-8', 'replace').split('\0') if cmdline else []
+    return (pid, name, uid, fields[0].decode(), int(fields[11]), int(fields[12]),
+            int(fields[21]), int(fields[19]), int(fields[17]), argv)
+
+#read every process once, return a list of read_process() tuples
+def scan():
+    try:
+        names = os.listdir(PROC)
+    except OSError:
+        raise ConfigError("process check: %s is not available on this system" % PROC)
+    processes = []
+    for entry in names:
+        if entry.isdigit():
+            process = read_process(int(entry))
+            if process is not None:
+                processes.append(process)
+    return processes
+
+#return the snapshot path, ZBX_PROC_SNAPSHOT overrides it
+def snapshot_path():
+    path = os.environ.get('ZBX_PROC_SNAPSHOT')
+    if path:
+        return path
+    for dirpath in SNAPSHOT_DIRS:
+        if os.path.isdir(dirpath):
+            return os.path.join(dirpath, SNAPSHOT_FILE)
+    return os.path.join(cache_dir(), SNAPSHOT_FILE)
+
+#seconds a snapshot is shared, ZBX_PROC_SNAPSHOT_TTL overrides SNAPSHOT_TTL, 0 disables it
+def snapshot_ttl():
+    try:
+        return float(os.environ['ZBX_PROC_SNAPSHOT_TTL'])
+    except (KeyError, ValueError):
+        return SNAPSHOT_TTL
+
+#return the snapshot at path when it is younger than ttl, else None
+#a snapshot someone else could have written, e.g. in /dev/shm, is not trusted
+def read_snapshot(path, ttl):
+    import marshal
+    try:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_uid != os.geteuid():
+                return None
+            version, taken, uptime, processes = marshal.loads(f.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+    if version != SNAPSHOT_VERSION or not 0 <= time.monotonic() - taken < ttl:
+        return None
+    return uptime, processes
+
+#return (uptime, processes) for all processes, read at most once per ttl seconds by all
+#callers together: the first one scans /proc under a lock on <snapshot>.lock and writes the
+#snapshot, callers arriving meanwhile wait for the lock and read its snapshot
+def take_snapshot(ttl=None, path=None):
+    ttl = snapshot_ttl() if ttl is None else ttl
+    if ttl <= 0:
+        return read_uptime(), scan()
+    path = path or snapshot_path()
+    snapshot = read_snapshot(path, ttl)
+    if snapshot is not None:
+        return snapshot
+    import fcntl
+    try:
+        lock = os.open(path + ".lock", os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    except OSError:
+        #nowhere to share it, scan alone
+        return read_uptime(), scan()
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        snapshot = read_snapshot(path, ttl)
+        if snapshot is not None:
+            return snapshot
+        taken = time.monotonic()
+        uptime, processes = read_uptime(), scan()
+        try:
+            import marshal
+            from zbx_util import atomic_write
+            atomic_write(path, marshal.dumps((SNAPSHOT_VERSION, taken, uptime, processes)))
+        except OSError:
+            pass
+        return uptime, processes
+    finally:
+        os.close(lock)
+
+#one config line, matched like proc.num[<process>,<user>,,<cmdline>]; a user that does not
+#exist matches no process, proc.num gives 0 for it too
+class ProcessRule:
+    def __init__(self, tag, name, user, cmdline=''):
+        self.tag = tag
+        self.name = name
+        self.uid = None
+        self.cmdline = cmdline
+        if user:
+            import pwd
+            try:
+                self.uid = pwd.getpwnam(user).pw_uid
+            except KeyError:
+                #no process runs as uid -1
+                self.uid = -1
+        if cmdline:
+            from zbx_patterns import compile_pattern, PatternError
+            try:
+                pattern = compile_pattern(cmdline)
+            except PatternError as e:
+                raise PatternError("zbx_processMonitor.conf: tag '%s', cmdline: %s" % (tag, e))
+            self.search = pattern.regex.search
+            self.keyword = pattern.keyword()
+
+    def match_user(self, process):
+        return self.uid is None or self.uid == process[UID]
+
+    def match_cmdline(self, cmdline):
+        return not self.cmdline or (self.keyword in cmdline and self.search(cmdline) is not None)
+
+#cmdline rules checked together: one regex made of all of them rejects a command line
+#none of them matches in a single search, which is what almost every process gets; only
+#the rest is tried rule by rule, behind each rule's longest literal
+class CmdlineMatcher:
+    def __init__(self, rules):
+        from zbx_patterns import combine
+        self.rules = rules
+        combined = combine([rule.cmdline for rule in rules]) if len(rules) > 1 else None
+        self.search = combined.search if combined is not None else None
+
+    def match(self, cmdline):
+        if self.search is not None and self.search(cmdline) is None:
+            return []
+        return [rule for rule in self.rules if rule.match_cmdline(cmdline)]
+
+#return {tag: [matching processes]} for the discovery rows of zbx_processMonitor.conf
+#a name matches the process name, or for a name the kernel cut at 15 bytes the base name
+#of argv[0], the same as proc.num; an empty {#PROCESS} matches every name and an empty
+#{#USER} every user; {#CMDLINE} is a regex searched in the arguments joined by spaces
+#a row with an invalid cmdline regex matches nothing, its error goes to errors by tag when
+#errors is a dict, else it is raised
+def match_processes(rows, processes=None, errors=None):
+    from zbx_patterns import PatternError
+    rules = []
+    for row in rows:
+        try:
+            rules.append(ProcessRule(row['{#TAG}'], row['{#PROCESS}'], row['{#USER}'], row.get('{#CMDLINE}', '')))
+        except PatternError as e:
+            if errors is None:
+                raise
+            errors[row['{#TAG}']] = str(e)
+    by_name = {}
+    long_names = []
+    any_name = []
+    any_cmdline = []
+    for rule in rules:
+        if not rule.name:
+            (any_cmdline if rule.cmdline else any_name).append(rule)
+            continue
+        by_name.setdefault(rule.name, []).append(rule)
+        if len(rule.name) > COMM_LEN:
+            long_names.append(rule)
+    cmdline_matcher = CmdlineMatcher(any_cmdline) if any_cmdline else None
+    matches = dict((row['{#TAG}'], []) for row in rows)
+    if processes is None:
+        processes = scan()
+    for process in processes:
+        name = process[NAME]
+        candidates = by_name.get(name, ())
+        if long_names and len(name) == COMM_LEN and process[CMDLINE]:
+            argv0 = os.path.basename(process[CMDLINE][0])
+            candidates = list(candidates) + [rule for rule in long_names
+                                             if rule.name == argv0 and rule.name.startswith(name)]
+        cmdline = None
+        if candidates and any(rule.cmdline for rule in candidates):
+            cmdline = ' '.join(process[CMDLINE])
+            candidates = [rule for rule in candidates if rule.match_cmdline(cmdline)]
+        if any_name:
+            candidates = list(candidates) + any_name
+        if cmdline_matcher is not None:
+            if cmdline is None:
+                cmdline = ' '.join(process[CMDLINE])
+            candidates = list(candidates) + cmdline_matcher.match(cmdline)
+        for rule in candidates:
+            if rule.match_user(process):
+                matches[rule.tag].append(process)
+    return matches
+
+#seconds since boot, the clock process start times are given in
+def read_uptime():
+    with open(PROC + "/uptime", 'rb') as f:
+        return float(f.read().split()[0])
+
+#number of open files, None when the process is not ours to look at
+def count_fds(pid):
+    try:
+        return len(os.listdir("%s/%d/fd" % (PROC, pid)))
+    except OSError:
+        return None
+
+#return {tag: {count, cpu, cpu_user, cpu_system, rss, threads, fds, error}} for the discovery
+#rows, error is the config error of a row that cannot be used (its count is 0) or empty
+#cpu is percent of one core since the previous sample, 0 on the first one; a pid is only
+#compared with its previous sample when its start time is unchanged, a reused pid counts
+#as a new process; fds only counts processes whose fd dir can be read
+#snapshot is (uptime, processes), by default the shared one from take_snapshot()
+def process_metrics(rows, snapshot=None, state_path=None):
+    state_path = state_path or os.path.join(cache_dir(), STATE_FILE)
+    uptime, processes = snapshot or take_snapshot()
+    errors = {}
+    matches = match_processes(rows, processes, errors)
+    state = read_json(state_path, {})
+    if state.get('version') != STATE_VERSION or state.get('uptime', uptime) > uptime:
+        #no previous sample, or one from before a reboot
+        state = {}
+    if state.get('uptime') == uptime:
+        #another caller shared this snapshot and already moved the state on, compare
+        #with the sample before it
+        base = state.get('previous', {})
+        new_state = None
+    else:
+        base = state
+        new_state = {'version': STATE_VERSION, 'uptime': uptime, 'pids': {},
+                     'previous': {'uptime': state.get('uptime'), 'pids': state.get('pids', {})}}
+    previous = base.get('pids', {})
+    last_uptime = base.get('uptime')
+    elapsed = uptime - last_uptime if last_uptime is not None else 0
+    clock_ticks = os.sysconf('SC_CLK_TCK')
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    samples = {}
+    metrics = {}
+    for tag, matched in matches.items():
+        user = system = rss = threads = fds = 0
+        for process in matched:
+            pid = process[PID]
+            samples[str(pid)] = [process[START_TICKS], process[UTIME], process[STIME]]
+            before = previous.get(str(pid))
+            if before is not None and before[0] == process[START_TICKS]:
+                user += process[UTIME] - before[1]
+                system += process[STIME] - before[2]
+            elif last_uptime is not None and process[START_TICKS] >= last_uptime * clock_ticks:
+                #started since the previous sample, all of its time falls in this interval
+                user += process[UTIME]
+                system += process[STIME]
+            rss += process[RSS_PAGES] * page_size
+            threads += process[THREADS]
+            fds += count_fds(pid) or 0
+        if elapsed > 0:
+            cpu_user = round(100.0 * user / clock_ticks / elapsed, 2)
+            cpu_system = round(100.0 * system / clock_ticks / elapsed, 2)
+        else:
+            cpu_user = cpu_system = 0.0
+        metrics[tag] = {
+            'count': len(matched),
+            'cpu': round(cpu_user + cpu_system, 2),
+            'cpu_user': cpu_user,
+            'cpu_system': cpu_system,
+            'rss': rss,
+            'threads': threads,
+            'fds': fds,
+            'error': errors.get(tag, '')
+        }
+    if new_state is not None:
+        new_state['pids'] = samples
+        try:
+            write_json(state_path, new_state)
+        except OSError:
+            pass
+    return metrics
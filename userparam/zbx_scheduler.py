@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+
+#resident scheduler for custom scripts that take longer than an agent Timeout
+#runs every zbx_customScriptMonitor.conf script with an interval column on its own
+#interval, first runs spread over the interval by a random offset, and keeps the latest
+#result of each in <cache dir>/zbx_customScript.results, replaced in one step;
+#moncheck[customscript] reads a scheduled script's result from there instead of running it,
+#with its age in seconds, so the agent never waits for the script
+#a script is killed when it runs longer than its interval
+#run as a service: /usr/bin/python3 /etc/zabbix/scripts/zbx_scheduler.py
+
+import os
+import sys
+import time
+import threading
+
+from zbx_util import ConfigError, cache_dir, read_json, write_json
+
+RESULTS_FILE = "zbx_customScript.results"
+RESULTS_VERSION = 1
+#the config is looked at and due scripts are started this often, seconds
+TICK = 1.0
+#scheduled scripts running at once
+MAX_PROCS = 8
+
+def log(message):
+    sys.stderr.write("%s zbx_scheduler: %s\n" % (time.strftime('%Y-%m-%d %H:%M:%S'), message))
+    sys.stderr.flush()
+
+def results_path():
+    return os.path.join(cache_dir(), RESULTS_FILE)
+
+#return the interval of a discovery row in seconds, None for a script without one
+def interval(row):
+    value = row.get('{#INTERVAL}', '')
+    if value in ('', '-'):
+        return None
+    try:
+        seconds = float(value)
+        if seconds <= 0:
+            raise ValueError(value)
+    except ValueError:
+        raise ConfigError("zbx_customScriptMonitor.conf: tag '%s', invalid interval '%s', expected seconds" % (row['{#TAG}'], value))
+    return seconds
+
+#return {tag: {code, output, values, parse_error, ms, error, age}} for scheduled rows from the
+#results file, age is the seconds since the result was taken; a script the scheduler has not
+#run yet has a null age and an error
+def read_results(rows):
+    data = read_json(results_path(), {})
+    if not isinstance(data, dict) or data.get('version') != RESULTS_VERSION:
+        data = {}
+    stored = data.get('results', {})
+    now = time.time()
+    results = {}
+    for row in rows:
+        result = stored.get(row['{#TAG}'])
+        if result is None or result.get('script') != row['{#SCRIPT}']:
+            results[row['{#TAG}']] = {'code': None, 'output': '', 'values': None, 'parse_error': '', 'ms': None,
+                                      'error': "no result yet, is zbx_scheduler.py running?", 'age': None}
+            continue
+        results[row['{#TAG}']] = {'code': result['code'], 'output': result['output'], 'values': result.get('values'),
+                                  'parse_error': result.get('parse_error', ''), 'ms': result['ms'],
+                                  'error': result['error'], 'age': round(max(0.0, now - result['finished']), 1)}
+    return results
+
+class Job:
+    def __init__(self, tag, script, seconds, now):
+        import random
+        self.tag = tag
+        self.script = script
+        self.interval = seconds
+        #a random first start spreads scripts with the same interval
+        self.next_run = now + random.uniform(0, seconds)
+        self.running = False
+
+class Scheduler:
+    def __init__(self):
+        self.path = results_path()
+        data = read_json(self.path, {})
+        if not isinstance(data, dict) or data.get('version') != RESULTS_VERSION:
+            data = {}
+        #tag -> latest result, results of a previous run stay readable after a restart
+        self.results = data.get('results', {})
+        self.jobs = {}
+        #tags not scheduled, their invalid interval is logged once
+        self.invalid = set()
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(MAX_PROCS)
+
+    def load_config(self, now):
+        import zbx_all_in_one
+        try:
+            rows = zbx_all_in_one.parse_config_customscript()
+        except (ConfigError, ValueError) as e:
+            log("%s, keeping the previous config" % e)
+            return
+        wanted = {}
+        invalid = set()
+        for row in rows:
+            #a row with an invalid interval is left out, moncheck[customscript] reports it
+            try:
+                seconds = interval(row)
+            except ConfigError as e:
+                if row['{#TAG}'] not in self.invalid:
+                    log("%s, not scheduled" % e)
+                invalid.add(row['{#TAG}'])
+                continue
+            if seconds is not None:
+                wanted[row['{#TAG}']] = (row['{#SCRIPT}'], seconds)
+        self.invalid = invalid
+        for tag in list(self.jobs):
+            job = self.jobs[tag]
+            if wanted.get(tag) != (job.script, job.interval):
+                del self.jobs[tag]
+        for tag, (script, seconds) in wanted.items():
+            if tag not in self.jobs:
+                self.jobs[tag] = Job(tag, script, seconds, now)
+                log("scheduled %s every %gs" % (tag, seconds))
+        with self.lock:
+            for tag in list(self.results):
+                if tag not in wanted:
+                    del self.results[tag]
+
+    def write_results(self):
+        try:
+            write_json(self.path, {'version': RESULTS_VERSION, 'pid': os.getpid(), 'results': self.results})
+        except OSError as e:
+            log("cannot write %s: %s" % (self.path, e))
+
+    def execute(self, job):
+        from zbx_scriptrun import run_script
+        try:
+            with self.slots:
+                result = run_script(job.script, job.interval, time.monotonic() + job.interval)
+            result['script'] = job.script
+            result['finished'] = time.time()
+            with self.lock:
+                if self.jobs.get(job.tag) is job:
+                    self.results[job.tag] = result
+                    self.write_results()
+        finally:
+            job.running = False
+
+    def run(self):
+        while True:
+            now = time.monotonic()
+            self.load_config(now)
+            for job in list(self.jobs.values()):
+                if job.running or now < job.next_run:
+                    continue
+                job.running = True
+                #fixed rate; a run that took longer than the interval starts the next one now
+                job.next_run = max(job.next_run + job.interval, now)
+                threading.Thread(target=self.execute, args=(job,), daemon=True).start()
+            wait = min([job.next_run for job in self.jobs.values() if not job.running] + [now + TICK]) - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+def main():
+    import signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    Scheduler().run()
+
+if __name__ == '__main__':
+    main()
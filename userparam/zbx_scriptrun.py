@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+
+#custom script runner for zbx_customScriptMonitor.conf
+#one system.run[{#SCRIPT}] item per script holds an agent poller for as long as the script
+#runs; this runs every script of the config at the same time, at most MAX_PROCS at once, and
+#returns {"<tag>": {"code": 0, "output": "...", "values": {...}, "ms": 41.2, ...}, ...}
+#for one master item, dependent items pick their tag
+#each script is killed after SCRIPT_TIMEOUT seconds, and all scripts still running when the
+#shared deadline passes are killed; on POSIX the whole process group of the script is
+#killed, so commands the shell started do not outlive it
+#scripts with an interval column are run by zbx_scheduler.py, their latest result is read
+#from its results file; age tells how old a result is, 0 for scripts run here
+#a script printing key=value lines or a JSON document gets them in "values" as one flat
+#object, so one run feeds many dependent items
+
+import os
+import sys
+import time
+import queue
+import threading
+
+from zbx_util import discovery_budget
+
+#seconds one script may run, like Timeout=10 for system.run
+SCRIPT_TIMEOUT = 10.0
+#scripts running at once
+MAX_PROCS = 8
+#characters of stdout kept, after stripping surrounding white space
+OUTPUT_LIMIT = 4096
+#stdout bytes parsed into values at most, and the number of values kept
+VALUES_LIMIT = 65536
+MAX_VALUES = 1000
+
+def start(command):
+    import subprocess
+    if sys.platform.startswith('win'):
+        return subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+    return subprocess.Popen(command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+
+def kill(process):
+    if sys.platform.startswith('win'):
+        process.kill()
+        return
+    import signal
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+def trim(output):
+    return output.decode('utf-8', 'replace').strip()[:OUTPUT_LIMIT]
+
+#nested objects and lists to one level, keys joined by dots: {"db": {"rows": [1, 2]}}
+#gives {"db.rows.0": 1, "db.rows.1": 2}
+def flatten(value, prefix, values):
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        values[prefix] = value
+        return
+    for key, item in items:
+        flatten(item, "%s.%s" % (prefix, key) if prefix else str(key), values)
+
+#return (values, parse error) for the stdout of a script
+#output starting with { or [ is JSON; output whose every line, blank lines and lines
+#starting with # aside, starts with a key (letters, digits, _ . -) and a single = is
+#key=value lines; other output, 'connect failed (errno=111)' or base64 ending in ==, is a
+#single value and gives (None, '')
+def parse_values(output):
+    import re
+    text = output.decode('utf-8', 'replace').strip()
+    is_json = text.startswith(('{', '['))
+    if not is_json:
+        lines = [line.strip() for line in text.splitlines()]
+        lines = [line for line in lines if line and not line.startswith('#')]
+        key_value = re.compile(r'[\w.\-]+\s*=(?!=)')
+        if not lines or not all(key_value.match(line) for line in lines):
+            return None, ''
+    if len(output) > VALUES_LIMIT:
+        return None, "output is larger than %d bytes" % VALUES_LIMIT
+    values = {}
+    if is_json:
+        import json
+        try:
+            document = json.loads(text)
+        except ValueError as e:
+            return None, "invalid JSON: %s" % e
+        flatten(document, '', values)
+    else:
+        for line in lines:
+            key, _, value = line.partition('=')
+            values[key.strip()] = value.strip()
+    if len(values) > MAX_VALUES:
+        return None, "%d values, at most %d are kept" % (len(values), MAX_VALUES)
+    return values, ''
+
+#run command, return {code, output, values, parse_error, ms, error}; the script is killed at
+#the first of timeout seconds and end (time.monotonic())
+def run_script(command, timeout, end):
+    import subprocess
+    started = time.monotonic()
+    limit = min(timeout, end - started)
+    try:
+        process = start(command)
+    except OSError as e:
+        return {'code': None, 'output': '', 'values': None, 'parse_error': '', 'ms': None, 'error': e.strerror or str(e)}
+    try:
+        output, _ = process.communicate(timeout=limit)
+        error = ''
+    except subprocess.TimeoutExpired:
+        kill(process)
+        try:
+            output, _ = process.communicate(timeout=1)
+        except subprocess.TimeoutExpired:
+            #something that left the process group still holds stdout
+            output = b''
+        error = "killed after %gs" % round(limit, 2)
+    ms = round((time.monotonic() - started) * 1000, 2)
+    #the output of a killed script may be cut anywhere
+    values, parse_error = parse_values(output) if not error else (None, '')
+    return {'code': None if error else process.returncode, 'output': trim(output), 'values': values,
+            'parse_error': parse_error, 'ms': ms, 'error': error}
+
+#return {tag: {code, output, values, parse_error, ms, error, age}} for the discovery rows of
+#zbx_customScriptMonitor.conf; code is the exit code, null for a script that was killed or
+#could not start; output is its trimmed stdout, values what parse_values found in it and ms
+#its run time; the whole run ends within
+#deadline seconds, default the discovery budget, scripts not started by then are reported
+#with an error, and so is a row with an invalid interval, the other rows run as usual
+def run_scripts(rows, timeout=SCRIPT_TIMEOUT, deadline=None, workers=MAX_PROCS):
+    from zbx_util import ConfigError
+    from zbx_scheduler import interval, read_results
+    invalid = {}
+    scheduled = []
+    for row in rows:
+        try:
+            if interval(row) is not None:
+                scheduled.append(row)
+        except ConfigError as e:
+            invalid[row['{#TAG}']] = {'code': None, 'output': '', 'values': None, 'parse_error': '', 'ms': None,
+                                      'error': str(e), 'age': None}
+    results = read_results(scheduled) if scheduled else {}
+    results.update(invalid)
+    if deadline is None:
+        deadline = discovery_budget()
+    end = time.monotonic() + deadline
+    tasks = queue.Queue()
+    for row in rows:
+        if row['{#TAG}'] not in results:
+            tasks.put((row['{#TAG}'], row['{#SCRIPT}']))
+
+    def work():
+        while True:
+            try:
+                tag, command = tasks.get_nowait()
+            except queue.Empty:
+                return
+            if time.monotonic() >= end:
+                results[tag] = {'code': None, 'output': '', 'values': None, 'parse_error': '', 'ms': None,
+                                'error': "not run within %gs" % deadline, 'age': None}
+                continue
+            results[tag] = run_script(command, timeout, end)
+            results[tag]['age'] = 0
+    threads = [threading.Thread(target=work) for _ in range(min(tasks.qsize(), workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict((row['{#TAG}'], results[row['{#TAG}']]) for row in rows)
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+#url result cache shared by url_check.py calls
+#template overlap and duplicate items poll the same url from several agent pollers, each
+#call opened its own connection; results are kept in <cache dir>/zbx_url.cache for
+#ZBX_URL_CACHE_TTL seconds (default 30, 0 = always probe), at most MAX_ENTRIES urls with
+#the least recently used dropped first
+#a caller without a fresh result takes the lock of its url, a byte of zbx_url.cache.lock
+#chosen by hash, and probes; callers arriving meanwhile wait for that lock and get its result
+
+import os
+import time
+import threading
+
+from zbx_util import cache_dir, read_json, write_json
+
+CACHE_FILE = "zbx_url.cache"
+CACHE_VERSION = 1
+TTL = 30
+MAX_ENTRIES = 512
+#urls hashing to the same slot wait for each other, slot 0 guards the cache file itself
+LOCK_SLOTS = 4096
+
+#lockf locks belong to the process: threads of the resident helper coalesce on these thread
+#locks, and the lock file stays open for the life of the process, closing any descriptor of
+#it would drop every range the process holds
+_slot_locks = {}
+_lock_fds = {}
+_slot_locks_lock = threading.Lock()
+
+#ZBX_URL_CACHE_TTL overrides TTL
+def cache_ttl():
+    try:
+        return float(os.environ['ZBX_URL_CACHE_TTL'])
+    except (KeyError, ValueError):
+        return TTL
+
+def slot(url):
+    import zlib
+    return 1 + zlib.crc32(url.encode('utf-8')) % LOCK_SLOTS
+
+#return the descriptor of the lock file at path opened once per process, None when it cannot
+#be opened
+def lock_fd(path):
+    with _slot_locks_lock:
+        if path not in _lock_fds:
+            try:
+                _lock_fds[path] = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+            except OSError:
+                _lock_fds[path] = None
+        return _lock_fds[path]
+
+#hold lock byte number of the lock file and the matching thread lock; without fcntl
+#(windows) only the thread lock is held
+class SlotLock:
+    def __init__(self, path, number):
+        self.path = path
+        self.number = number
+        self.fd = None
+        with _slot_locks_lock:
+            self.thread_lock = _slot_locks.setdefault((path, number), threading.Lock())
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            import fcntl
+            fd = lock_fd(self.path)
+            if fd is not None:
+                fcntl.lockf(fd, fcntl.LOCK_EX, 1, self.number)
+                self.fd = fd
+        except (ImportError, OSError):
+            #nowhere to share it, go alone
+            pass
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.fd is not None:
+            import fcntl
+            try:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, self.number)
+            except OSError:
+                pass
+            self.fd = None
+        self.thread_lock.release()
+
+class UrlResultCache:
+    def __init__(self, path=None, ttl=None, max_entries=MAX_ENTRIES):
+        self.path = path or os.path.join(cache_dir(), CACHE_FILE)
+        self.lock_path = self.path + ".lock"
+        self.ttl = cache_ttl() if ttl is None else ttl
+        self.max_entries = max_entries
+
+    #url -> [checked at, last used at (epoch seconds), value]
+    def _read(self):
+        data = read_json(self.path, {})
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return {}
+        return data.get('urls', {})
+
+    def _fresh(self, entries, url, now):
+        entry = entries.get(url)
+        return entry is not None and 0 <= now - entry[0] < self.ttl
+
+    #write url's value, or only its use when value is None; the least recently used urls
+    #beyond max_entries are dropped
+    def _store(self, url, now, value=None):
+        with SlotLock(self.lock_path, 0):
+            entries = self._read()
+            if value is not None:
+                entries[url] = [now, now, value]
+            elif url in entries:
+                entries[url][1] = now
+            else:
+                return
+            if len(entries) > self.max_entries:
+                for old in sorted(entries, key=lambda key: entries[key][1])[:len(entries) - self.max_entries]:
+                    del entries[old]
+            try:
+                write_json(self.path, {'version': CACHE_VERSION, 'urls': entries})
+            except OSError:
+                pass
+
+    #return the cached value of url, or probe() it once for all concurrent callers
+    def get(self, url, probe):
+        if self.ttl <= 0:
+            return probe()
+        now = time.time()
+        entries = self._read()
+        if self._fresh(entries, url, now):
+            #the use is written at most once per ttl, a hit stays a read
+            if not 0 <= now - entries[url][1] < self.ttl:
+                self._store(url, now)
+            return entries[url][2]
+        with SlotLock(self.lock_path, slot(url)):
+            entries = self._read()
+            now = time.time()
+            if self._fresh(entries, url, now):
+                return entries[url][2]
+            value = probe()
+            self._store(url, time.time(), value)
+            return value
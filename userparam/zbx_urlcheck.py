@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+
+#bulk url check for zbx_urlMonitor.conf
+#url_check.py starts a python per url and never sends {#SERVERNAME}; this checks every url of
+#the config in one run: urls are grouped by origin (scheme, host, port and server name), the
+#origins are checked at the same time, and the urls of one origin share up to
+#ORIGIN_CONNECTIONS keep-alive connections; a connection goes to the url's host,
+#{#SERVERNAME} is sent as Host header and TLS server name (SNI) when it is set
+#returns {"<tag>": {"status": 200, "dns": 0.0, "connect": 0.3, "tls": 4.1, "ttfb": 6.2, "ms": 12.5,
+#"bytes": 512, "match": 1, "error": ""}, ...} for one master item, a slow check shows which
+#phase is slow; redirects are not followed, their 3xx status is reported
+#the optional probe column bounds what is read: head, range:<bytes> or get:<bytes>; the
+#optional match column is a regex searched in that bounded body
+#https connections resume the TLS session of the last connection to their origin made by
+#this process: the other connections of an origin start once the first one has its session,
+#and in the resident helper later runs resume it too
+
+import time
+import queue
+import threading
+
+from zbx_util import ConfigError, discovery_budget
+from zbx_dns import DnsCache, RESOLVE_TIMEOUT
+
+#seconds one request may take, connect included
+REQUEST_TIMEOUT = 5.0
+#connections open at once
+MAX_WORKERS = 16
+#connections to one origin, its urls are spread over them
+ORIGIN_CONNECTIONS = 4
+#body bytes read at most when the probe column sets no limit
+MAX_BODY = 1048576
+
+#a session can only be resumed with the context it came from, one context per process
+_tls_context = None
+#origin -> ssl.SSLSession of its last https connection, set and read from worker threads
+_sessions = {}
+
+def tls_context():
+    global _tls_context
+    if _tls_context is None:
+        import ssl
+        _tls_context = ssl.create_default_context()
+    return _tls_context
+
+#one url of the config, its origin is what a connection can be shared by
+class UrlRequest:
+    def __init__(self, tag, url, servername, probe='', match=''):
+        from urllib.parse import urlsplit
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError as e:
+            raise ConfigError("zbx_urlMonitor.conf: tag '%s', invalid url '%s': %s" % (tag, url, e))
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ConfigError("zbx_urlMonitor.conf: tag '%s', url must start with http:// or https://, got '%s'" % (tag, url))
+        self.tag = tag
+        self.url = url
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = port or (443 if parts.scheme == 'https' else 80)
+        self.servername = servername if servername not in ('', '-') else ''
+        self.target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        self.method = 'GET'
+        self.headers = {'User-Agent': 'zbx_urlcheck'}
+        self.limit = MAX_BODY
+        self._probe(probe)
+        self.search = None
+        if match:
+            if self.method == 'HEAD':
+                raise ConfigError("zbx_urlMonitor.conf: tag '%s', match needs a body, probe head reads none" % tag)
+            from zbx_patterns import compile_pattern, PatternError
+            try:
+                pattern = compile_pattern(match)
+            except PatternError as e:
+                raise PatternError("zbx_urlMonitor.conf: tag '%s', match: %s" % (tag, e))
+            self.search = pattern.regex.search
+
+    #probe: get (default, '-' too), head, range:<bytes> (GET asking for the first bytes, read
+    #no more than that when the server sends the whole body anyway) or get:<bytes> (read that
+    #much of the body, then close the connection)
+    def _probe(self, probe):
+        kind, _, size = probe.lower().partition(':')
+        if kind in ('', '-', 'get') and not size:
+            return
+        if kind == 'head' and not size:
+            self.method = 'HEAD'
+            self.limit = 0
+            return
+        try:
+            limit = int(size)
+            if kind not in ('get', 'range') or limit <= 0:
+                raise ValueError(probe)
+        except ValueError:
+            raise ConfigError("zbx_urlMonitor.conf: tag '%s', invalid probe '%s', expected get, head, range:<bytes> or get:<bytes>" % (self.tag, probe))
+        self.limit = limit
+        if kind == 'range':
+            self.headers['Range'] = 'bytes=0-%d' % (limit - 1)
+
+    def origin(self):
+        return self.scheme, self.host, self.port, self.servername
+
+#one keep-alive connection to an origin
+#dns is the seconds the check waited for the host name, it counts for the first request
+class OriginConnection:
+    def __init__(self, origin, addresses, timeout, dns=0.0):
+        self.origin = origin
+        self.scheme, self.host, self.port, self.servername = origin
+        self.addresses = addresses
+        self.timeout = timeout
+        self.dns = dns
+        self.connection = None
+        #seconds the last tcp connect took, the tls handshake follows it in connect()
+        self.tcp = 0.0
+        #of the https connection: 1 when its handshake resumed a session, else 0, and the
+        #expiry of the server certificate in epoch seconds
+        self.resumed = None
+        self.expires = None
+
+    def _connect(self):
+        import socket
+        import http.client
+        addresses = self.addresses
+
+        def create_connection(address, timeout, source_address=None):
+            start = time.perf_counter()
+            error = OSError("no address for %s" % self.host)
+            for ip in addresses:
+                try:
+                    sock = socket.create_connection((ip, address[1]), timeout, source_address)
+                except OSError as e:
+                    error = e
+                    continue
+                self.tcp = time.perf_counter() - start
+                return sock
+            raise error
+
+        #the Host header and SNI come from the name the connection is made for
+        name = self.servername or self.host
+        if self.scheme == 'https':
+            connection = http.client.HTTPSConnection(name, self.port, timeout=self.timeout, context=tls_context())
+            connection.connect = lambda: self._tls_connect(connection, name)
+        else:
+            connection = http.client.HTTPConnection(name, self.port, timeout=self.timeout)
+        connection._create_connection = create_connection
+        return connection
+
+    #HTTPSConnection.connect offering the session of the origin's last connection
+    def _tls_connect(self, connection, name):
+        import ssl
+        import http.client
+        http.client.HTTPConnection.connect(connection)
+        session = _sessions.get(self.origin)
+        connection.sock = connection._context.wrap_socket(connection.sock, server_hostname=name, session=session)
+        self.resumed = 1 if connection.sock.session_reused else 0
+        cert = connection.sock.getpeercert()
+        self.expires = int(ssl.cert_time_to_seconds(cert['notAfter'])) if cert and 'notAfter' in cert else None
+
+    #send request, return (status, {dns, connect, tls, ttfb, ms}, body) with the phases in
+    #seconds; dns, connect and tls are 0 on a kept-alive connection, ttfb is from the request
+    #sent to the response headers, ms is the whole request
+    #no more than request.limit body bytes are read, the connection is closed when more are
+    #left; a kept-alive connection the server closed meanwhile is opened again once
+    def get(self, request):
+        import http.client
+        for attempt in (0, 1):
+            phases = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0}
+            start = time.perf_counter()
+            reused = self.connection is not None and self.connection.sock is not None
+            try:
+                if not reused:
+                    if self.connection is None:
+                        self.connection = self._connect()
+                    self.connection.connect()
+                    phases['connect'] = time.perf_counter() - start
+                    if self.scheme == 'https':
+                        phases['connect'], phases['tls'] = self.tcp, phases['connect'] - self.tcp
+                    phases['dns'], self.dns = self.dns, 0.0
+                self.connection.request(request.method, request.target, headers=request.headers)
+                sent = time.perf_counter()
+                response = self.connection.getresponse()
+                headers = time.perf_counter()
+                body = response.read(request.limit)
+                #a TLS 1.3 session ticket arrives after the handshake, the session is complete now
+                if self.scheme == 'https' and self.connection.sock is not None and self.connection.sock.session is not None:
+                    _sessions[self.origin] = self.connection.sock.session
+                if not response.isclosed():
+                    self.close()
+                end = time.perf_counter()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.close()
+                if not reused or attempt:
+                    raise
+                continue
+            except Exception:
+                self.close()
+                raise
+            phases['ttfb'] = headers - sent
+            phases['ms'] = phases['dns'] + end - start
+            return response.status, phases, body
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+def error_text(e):
+    import ssl
+    import socket
+    if isinstance(e, socket.timeout):
+        return "timed out"
+    if isinstance(e, ssl.SSLError):
+        return getattr(e, 'verify_message', None) or e.reason or str(e)
+    if isinstance(e, OSError) and e.strerror:
+        return e.strerror
+    return str(e) or type(e).__name__
+
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'ms')
+
+def result(status, phases=None, size=0, match=None, error='', connection=None):
+    check = {'status': status}
+    for phase in PHASES:
+        check[phase] = round(phases[phase] * 1000, 2) if phases else None
+    check['bytes'] = size
+    check['match'] = match
+    check['resumed'] = connection.resumed if connection else None
+    check['cert_expires'] = connection.expires if connection else None
+    check['error'] = error
+    return check
+
+#check the urls of one origin one after another on one connection
+#opened, a threading.Event, is set once the first request is done, its TLS session is stored by then
+def check_origin(origin, requests, addresses, timeout, results, dns=0.0, opened=None):
+    connection = OriginConnection(origin, addresses, timeout, dns)
+    try:
+        for request in requests:
+            try:
+                status, phases, body = connection.get(request)
+            except Exception as e:
+                results.put((request.tag, result(0, error=error_text(e))))
+                continue
+            finally:
+                if opened is not None:
+                    opened.set()
+            match = None
+            if request.search is not None:
+                match = 1 if request.search(body.decode('utf-8', 'replace')) else 0
+            results.put((request.tag, result(status, phases, len(body), match, connection=connection)))
+    finally:
+        connection.close()
+
+#return {tag: {status, dns, connect, tls, ttfb, ms, bytes, match, resumed, cert_expires, error}}
+#for the discovery rows of zbx_urlMonitor.conf, times in milliseconds from the monotonic clock,
+#null without a response; resumed and cert_expires are null for http
+#status is 0 when no response came, a row with an invalid url, probe or match gets its
+#config error and the other rows are checked; ms is the time to the full response, the first url of a
+#connection includes resolving and connecting; the whole check ends within deadline seconds
+#dns is the zbx_dns.DnsCache to resolve through, by default the one on disk
+def check_urls(rows, timeout=REQUEST_TIMEOUT, deadline=None, dns=None, workers=MAX_WORKERS):
+    if deadline is None:
+        deadline = discovery_budget()
+    start = time.monotonic()
+    checks = {}
+    origins = {}
+    for row in rows:
+        try:
+            request = UrlRequest(row['{#TAG}'], row['{#URL}'], row['{#SERVERNAME}'], row.get('{#PROBE}', ''), row.get('{#MATCH}', ''))
+        except ConfigError as e:
+            checks[row['{#TAG}']] = result(0, error=str(e))
+            continue
+        origins.setdefault(request.origin(), []).append(request)
+    if dns is None:
+        dns = DnsCache()
+    resolved = dns.resolve_all([origin[1] for origin in origins], min(deadline / 2, RESOLVE_TIMEOUT))
+    #(origin, requests, event the task sets after its first request, event it waits for)
+    #the first connection of every origin is queued before the others; the other https
+    #connections of an origin wait for the first one to have a TLS session they can resume
+    first = []
+    others = []
+    for origin, origin_requests in origins.items():
+        if origin[1] in resolved:
+            connections = min(len(origin_requests), ORIGIN_CONNECTIONS)
+            opened = threading.Event() if origin[0] == 'https' and connections > 1 else None
+            first.append((origin, origin_requests[::connections], opened, None))
+            for index in range(1, connections):
+                others.append((origin, origin_requests[index::connections], None, opened))
+        else:
+            for request in origin_requests:
+                checks[request.tag] = result(0, error=dns.errors.get(origin[1], "no address"))
+    tasks = queue.Queue()
+    for task in first + others:
+        tasks.put(task)
+    results = queue.Queue()
+
+    def work():
+        while True:
+            try:
+                origin, origin_requests, opened, wait_for = tasks.get_nowait()
+            except queue.Empty:
+                return
+            if wait_for is not None:
+                wait_for.wait(timeout)
+            check_origin(origin, origin_requests, resolved[origin[1]], timeout, results, dns.waited.get(origin[1], 0.0), opened)
+    #daemon threads, a server that hangs does not keep the process alive past the deadline
+    for _ in range(min(tasks.qsize(), workers)):
+        threading.Thread(target=work, daemon=True).start()
+    end = start + deadline
+    while len(checks) < len(rows):
+        left = end - time.monotonic()
+        if left <= 0:
+            break
+        try:
+            tag, check = results.get(timeout=left)
+        except queue.Empty:
+            break
+        checks[tag] = check
+    dns.save()
+    for row in rows:
+        if row['{#TAG}'] not in checks:
+            checks[row['{#TAG}']] = result(0, error="not checked within %gs" % deadline)
+    return dict((row['{#TAG}'], checks[row['{#TAG}']]) for row in rows)
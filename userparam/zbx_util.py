@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+#shared helpers for the zbx_* scripts: well-known locations and atomic file writes
+#copy this file into the scripts dir next to zbx_all_in_one.py
+#imports are kept inside the functions, entry points load this module on every call
+
+import os
+import sys
+
+_scripts_dir = None
+
+#a config line that cannot be used, the message names the file and the line
+class ConfigError(ValueError):
+    pass
+
+#return the zabbix scripts dir, ZBX_SCRIPTS_DIR overrides the per-OS default
+def scripts_dir():
+    global _scripts_dir
+    if _scripts_dir is None:
+        path = os.environ.get('ZBX_SCRIPTS_DIR')
+        if not path:
+            path = "C:\\zabbix\\scripts\\" if sys.platform.startswith('win') else "/etc/zabbix/scripts/"
+        os.makedirs(path, exist_ok=True)
+        _scripts_dir = path
+    return _scripts_dir
+
+#return the dir for discovery caches and state files, ZBX_CACHE_DIR overrides <scripts dir>/cache
+def cache_dir():
+    path = os.environ.get('ZBX_CACHE_DIR') or os.path.join(scripts_dir(), 'cache')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+#Timeout from the local agent config, zabbix defaults to 3 seconds
+def agent_timeout():
+    if sys.platform.startswith('win'):
+        candidates = ["C:\\zabbix\\zabbix_agent2.conf", "C:\\zabbix\\zabbix_agentd.conf"]
+    else:
+        candidates = ["/etc/zabbix/zabbix_agent2.conf", "/etc/zabbix/zabbix_agentd.conf"]
+    for path in candidates:
+        timeout = None
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith('Timeout='):
+                        timeout = line[len('Timeout='):].strip()
+        except OSError:
+            continue
+        if timeout:
+            try:
+                return float(timeout.rstrip('s'))
+            except ValueError:
+                pass
+    return 3.0
+
+#seconds a discovery run may spend walking, a little below the agent Timeout so the
+#agent always gets an answer; ZBX_DISCOVERY_BUDGET overrides it
+def discovery_budget():
+    try:
+        return float(os.environ['ZBX_DISCOVERY_BUDGET'])
+    except (KeyError, ValueError):
+        return max(1.0, agent_timeout() - 1.0)
+
+#replace path with data in one step so concurrent readers never see a half written file
+def atomic_write(path, data):
+    import tempfile
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+#load a json state file, a missing or corrupt file gives default
+def read_json(path, default=None):
+    import json
+    try:
+        with open(path, 'rb') as f:
+            return json.loads(f.read().decode('utf-8'))
+    except (OSError, ValueError):
+        return default
+
+def write_json(path, obj):
+    import json
+    atomic_write(path, json.dumps(obj, separators=(',', ':')).encode('utf-8'))
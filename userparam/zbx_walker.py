@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+
+#os.scandir based directory walker shared by log and filecount discovery
+#directories are listed by a bounded thread pool, so independent subtrees and config
+#roots are scanned at the same time; on NFS backed volumes a walk is mostly I/O wait
+#results come back in the same order os.walk(top) would give them
+#a walk can be given a deadline, directories not listed by then are taken from a
+#fallback (the discovery cache) and reported in Walker.pending
+
+import os
+import re
+import time
+import queue
+import threading
+from collections import deque
+
+DEFAULT_WORKERS = 8
+
+#split a directory into file names, the subdirectories os.walk would descend into and
+#symlinks to directories; DirEntry carries the d_type from readdir, so no stat() per entry
+def list_entries(dirpath):
+    files = []
+    subdirs = []
+    links = []
+    try:
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    files.append(entry.name)
+                    continue
+                try:
+                    is_symlink = entry.is_symlink()
+                except OSError:
+                    is_symlink = False
+                if is_symlink:
+                    links.append(entry.name)
+                else:
+                    subdirs.append(entry.name)
+    except OSError:
+        return None
+    return files, subdirs, links
+
+#default lister, return (filenames, subdirs, links, (st_dev, st_ino)) or None when dirpath cannot be read
+def scan_dir(dirpath):
+    try:
+        st = os.stat(dirpath)
+    except OSError:
+        return None
+    listing = list_entries(dirpath)
+    if listing is None:
+        return None
+    return listing + ((st.st_dev, st.st_ino),)
+
+#pruning for one root, the defaults walk like os.walk(top)
+class WalkOptions:
+    def __init__(self, max_depth=None, exclude=None, one_filesystem=False, follow_symlinks=False):
+        #directory levels searched below the root, 0 lists the root only
+        self.max_depth = max_depth
+        #compiled pattern, directories whose name matches are neither listed nor descended
+        self.exclude = exclude
+        #do not cross into directories on another device (mount points)
+        self.one_filesystem = one_filesystem
+        #descend into symlinked directories, a link back to an ancestor is not followed
+        self.follow_symlinks = follow_symlinks
+
+    def key(self):
+        return (self.max_depth, self.exclude and self.exclude.source, self.one_filesystem, self.follow_symlinks)
+
+DEFAULT_OPTIONS = WalkOptions()
+
+_mount_points = False
+
+#mount points from /proc/self/mountinfo, None where there is no such file
+def mount_points():
+    global _mount_points
+    if _mount_points is False:
+        try:
+            with open('/proc/self/mountinfo', 'rb') as f:
+                _mount_points = set()
+                for line in f:
+                    #mount point is the 5th field, spaces and the like are octal escaped
+                    path = re.sub(br'\\([0-7]{3})', lambda m: bytes([int(m.group(1), 8)]), line.split(b' ')[4])
+                    _mount_points.add(os.fsdecode(path))
+        except (OSError, IndexError):
+            _mount_points = None
+    return _mount_points
+
+#traversal state of one root
+class RootWalk:
+    def __init__(self, root, options):
+        self.root = root
+        self.options = options
+        self.device = None
+        #dirpath -> (filenames, names of the subdirectories descended into)
+        self.tree = {}
+        #False when part of the tree came from the fallback after the deadline
+        self.complete = True
+
+#worker threads listing directories; daemon threads, so a listing stuck on a dead NFS
+#server past the deadline does not hold up the exit of the process
+class ListerPool:
+    def __init__(self, lister, workers):
+        self.tasks = queue.Queue()
+        self.results = queue.Queue()
+        self.workers = workers
+        for _ in range(workers):
+            threading.Thread(target=self._work, args=(lister,), daemon=True).start()
+
+    def _work(self, lister):
+        while True:
+            dirpath = self.tasks.get()
+            if dirpath is None:
+                return
+            try:
+                self.results.put((dirpath, lister(dirpath), None))
+            except Exception as e:
+                self.results.put((dirpath, None, e))
+
+    def submit(self, dirpath):
+        self.tasks.put(dirpath)
+
+    #return (dirpath, listing) of the next finished listing, raise queue.Empty after timeout
+    def get(self, timeout=None):
+        dirpath, listing, error = self.results.get(timeout=timeout)
+        if error is not None:
+            raise error
+        return dirpath, listing
+
+    def close(self):
+        try:
+            while True:
+                self.tasks.get_nowait()
+        except queue.Empty:
+            pass
+        for _ in range(self.workers):
+            self.tasks.put(None)
+
+class Walker:
+    #lister(dirpath) returns (filenames, subdirs, links, (st_dev, st_ino)) or None, e.g. scan_dir or DirCache.listdir
+    #fallback(dirpath) returns the same without touching the disk, e.g. DirCache.cached
+    def __init__(self, lister=scan_dir, max_workers=DEFAULT_WORKERS, fallback=None):
+        self.lister = lister
+        self.max_workers = max(1, max_workers)
+        self.fallback = fallback
+        #directories that were not listed before the deadline of the last scan
+        self.pending = []
+
+    #list every directory under roots, return a RootWalk per distinct root
+    #options maps a root to its WalkOptions, a directory is listed once however many roots reach it
+    #deadline is a time.monotonic() value, cursor lists directories to list first
+    def scan(self, roots, options=None, deadline=None, cursor=()):
+        options = options or {}
+        walks = dict((root, RootWalk(root, options.get(root, DEFAULT_OPTIONS))) for root in roots)
+        listings = {}
+        #dirpath -> [(walk, depth, ancestor idents)] still waiting for that listing
+        waiting = {}
+        todo = deque()
+        #directories resolved by the fallback after the deadline, and those a walk used
+        stale = set()
+        used = set()
+
+        def visit(walk, dirpath, depth, ancestors):
+            if dirpath in listings:
+                expand(walk, dirpath, depth, ancestors)
+            elif dirpath in waiting:
+                waiting[dirpath].append((walk, depth, ancestors))
+            else:
+                waiting[dirpath] = [(walk, depth, ancestors)]
+                todo.append(dirpath)
+
+        def expand(walk, dirpath, depth, ancestors):
+            if dirpath in stale:
+                walk.complete = False
+                used.add(dirpath)
+            listing = listings[dirpath]
+            if listing is None:
+                return
+            files, subdirs, links, ident = listing
+            opts = walk.options
+            if depth == 0:
+                walk.device = ident[0]
+            elif opts.one_filesystem and ident[0] != walk.device:
+                return
+            if opts.follow_symlinks:
+                if ident in ancestors:
+                    return
+                ancestors = ancestors + (ident,)
+                subdirs = subdirs + links
+            if opts.max_depth is not None and depth >= opts.max_depth:
+                subdirs = []
+            if opts.exclude is not None:
+                subdirs = [name for name in subdirs if not opts.exclude.match(name)]
+            if opts.one_filesystem and subdirs:
+                mounts = mount_points()
+                if mounts:
+                    subdirs = [name for name in subdirs if os.path.normpath(os.path.join(dirpath, name)) not in mounts]
+            walk.tree[dirpath] = (files, subdirs)
+            for name in subdirs:
+                visit(walk, os.path.join(dirpath, name), depth + 1, ancestors)
+
+        def done(dirpath, listing):
+            listings[dirpath] = listing
+            for walk, depth, ancestors in waiting.pop(dirpath, ()):
+                expand(walk, dirpath, depth, ancestors)
+
+        #directories the previous scan did not get to are listed first
+        for dirpath in cursor:
+            if dirpath not in waiting:
+                waiting[dirpath] = []
+                todo.append(dirpath)
+        for walk in walks.values():
+            visit(walk, walk.root, 0, ())
+
+        if self.max_workers == 1:
+            while todo:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                dirpath = todo.popleft()
+                done(dirpath, self.lister(dirpath))
+            unlisted = list(todo)
+        else:
+            pool = ListerPool(self.lister, self.max_workers)
+            running = set()
+            try:
+                while todo or running:
+                    while todo:
+                        if deadline is not None and time.monotonic() >= deadline:
+                            break
+                        dirpath = todo.popleft()
+                        running.add(dirpath)
+                        pool.submit(dirpath)
+                    timeout = None
+                    if deadline is not None:
+                        timeout = deadline - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    try:
+                        dirpath, listing = pool.get(timeout)
+                    except queue.Empty:
+                        break
+                    running.discard(dirpath)
+                    done(dirpath, listing)
+            finally:
+                pool.close()
+            unlisted = list(running) + list(todo)
+
+        #out of time: finish the walk from what the fallback knows about the rest
+        todo = deque(unlisted)
+        while todo:
+            dirpath = todo.popleft()
+            if dirpath in listings:
+                continue
+            stale.add(dirpath)
+            done(dirpath, self.fallback(dirpath) if self.fallback else None)
+        self.pending = [dirpath for dirpath in unlisted if dirpath in used]
+        return walks
+
+    #walk several roots at once, return {root: [(dirpath, filenames), ...]} in os.walk order
+    def walk_many(self, roots, options=None, deadline=None, cursor=()):
+        walks = self.scan(roots, options, deadline, cursor)
+        return dict((root, list(iter_tree(walk.tree, root))) for root, walk in walks.items())
+
+#replay a scanned tree top-down, the way os.walk yields it
+def iter_tree(tree, top):
+    stack = [top]
+    while stack:
+        dirpath = stack.pop()
+        node = tree.get(dirpath)
+        if node is None:
+            continue
+        files, subdirs = node
+        yield dirpath, files
+        stack.extend(os.path.join(dirpath, name) for name in reversed(subdirs))